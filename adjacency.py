@@ -0,0 +1,168 @@
+# Sparse adjacency matrices for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import numpy as np
+
+"""Sparse adjacency export for SDBL graphs"""
+
+__version__ = 1.0
+
+
+class SdblAdjacencyException(Exception):
+    pass
+
+
+class SdblSparseAdjacency:
+    """Symmetric adjacency in coordinate form with a sorted node index.
+
+    Each stored entry belongs to a layer (an edge mode or evidence channel).
+    The combined matrix takes the maximum weight over layers, which is how
+    SdblEdgeProperty merges scores."""
+
+    def __init__(self, nodes, row, col, data, layer, layer_names):
+        self.nodes = np.asarray(nodes, dtype=str)
+        self.row = np.asarray(row, dtype=np.int32)
+        self.col = np.asarray(col, dtype=np.int32)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.layer = np.asarray(layer, dtype=np.int16)
+        self.layer_names = np.asarray(layer_names, dtype=str)
+        self.node_index = {n: i for i, n in enumerate(self.nodes)}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def shape(self):
+        return (len(self.nodes), len(self.nodes))
+
+    @classmethod
+    def from_edges(cls, edges, nodes=None):
+        """Build from (key, SdblEdgeProperty) pairs as produced by
+        SdblEdgeEngine, where key is (node1, node2, mode).  Extra 'nodes'
+        (disconnected genes, for instance) are added to the index."""
+        u = list()
+        v = list()
+        modes = list()
+        scores = list()
+
+        for k, p in edges:
+            u.append(k[0])
+            v.append(k[1])
+            modes.append(k[2])
+            scores.append(p.score)
+
+        return cls.from_arrays(u, v, modes, scores, nodes=nodes)
+
+    @classmethod
+    def from_arrays(cls, u, v, modes, weights, nodes=None):
+        u = np.asarray(u, dtype=str)
+        v = np.asarray(v, dtype=str)
+        names = [u, v]
+
+        if nodes is not None:
+            names.append(np.asarray(list(nodes), dtype=str))
+
+        index, inverse = np.unique(np.concatenate(names), return_inverse=True)
+        ui = inverse[:len(u)]
+        vi = inverse[len(u):len(u) + len(v)]
+
+        layer_names, layer = np.unique(np.asarray(modes, dtype=str),
+                return_inverse=True)
+        weights = np.asarray(weights, dtype=np.float64)
+
+        # store both triangles so that row slices see every neighbour;
+        # self loops are stored once
+        loop = ui == vi
+        row = np.concatenate([ui, vi[~loop]])
+        col = np.concatenate([vi, ui[~loop]])
+        data = np.concatenate([weights, weights[~loop]])
+        layer = np.concatenate([layer, layer[~loop]])
+
+        return cls(index, row, col, data, layer, layer_names)
+
+    @classmethod
+    def from_agraph(cls, A):
+        """Build from the edges of a pygraphviz AGraph, for graphs loaded
+        from DOT.  Edges without a weight get 1.0; the mode is taken from the
+        edge key when present."""
+        u = list()
+        v = list()
+        modes = list()
+        weights = list()
+
+        for e in A.edges():
+            w = e.attr.get("weight")
+            u.append(e[0])
+            v.append(e[1])
+            modes.append(_mode_from_key(e.name))
+            weights.append(float(w) if w else 1.0)
+
+        return cls.from_arrays(u, v, modes, weights, nodes=A.nodes())
+
+    def _select(self, layer):
+        if layer is None:
+            return self.row, self.col, self.data
+
+        hits = np.flatnonzero(self.layer_names == layer)
+
+        if len(hits) == 0:
+            estr = "No such layer: {}".format(layer)
+            raise SdblAdjacencyException(estr)
+
+        mask = self.layer == hits[0]
+
+        return self.row[mask], self.col[mask], self.data[mask]
+
+    def coo_arrays(self, layer=None):
+        """(row, col, data) with one entry per cell.  With layer=None the
+        layers are merged by maximum weight."""
+        row, col, data = self._select(layer)
+
+        if layer is not None:
+            return row, col, data
+
+        cell = row.astype(np.int64) * len(self.nodes) + col
+        cells, inverse = np.unique(cell, return_inverse=True)
+        merged = np.full(len(cells), -np.inf)
+        np.maximum.at(merged, inverse, data)
+
+        return ((cells // len(self.nodes)).astype(np.int32),
+                (cells % len(self.nodes)).astype(np.int32), merged)
+
+    def to_coo(self, layer=None):
+        """scipy.sparse.coo_matrix of one layer or of all layers merged"""
+        import scipy.sparse
+
+        row, col, data = self.coo_arrays(layer)
+
+        return scipy.sparse.coo_matrix((data, (row, col)), shape=self.shape)
+
+    def to_csr(self, layer=None):
+        return self.to_coo(layer).tocsr()
+
+    def layers(self):
+        """Dictionary of layer name to CSR matrix"""
+        return {str(n): self.to_csr(str(n)) for n in self.layer_names}
+
+    def save(self, filename):
+        """Write a compressed .npz file"""
+        np.savez_compressed(filename, nodes=self.nodes, row=self.row,
+                col=self.col, data=self.data, layer=self.layer,
+                layer_names=self.layer_names)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename, allow_pickle=False) as z:
+            return cls(z["nodes"], z["row"], z["col"], z["data"], z["layer"],
+                    z["layer_names"])
+
+
+def _mode_from_key(key):
+    """Edge keys are written as str((node1, node2, mode))"""
+    if not key:
+        return ""
+
+    tok = key.strip("()").split(",")
+
+    return tok[-1].strip().strip("'\"") if len(tok) == 3 else key
@@ -0,0 +1,163 @@
+# Connectivity analytics for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+"""Connected components, degrees and isolated genes from edge data"""
+
+__version__ = 1.0
+
+
+class SdblConnectivity:
+    """Union-find over the edges of a graph.
+
+    Edges are added once, in a single pass; components, degrees, isolated
+    input genes and shared leaf nodes are then read without going back to
+    the graph.  Degrees count a self loop twice, as Graphviz does."""
+
+    def __init__(self, edges=(), inputs=None):
+        self.parent = dict()
+        self.size = dict()
+        self.degrees = dict()
+        self.inputs = list()
+
+        if inputs is not None:
+            self.set_inputs(inputs)
+
+        for u, v in edges:
+            self.add_edge(u, v)
+
+    def __contains__(self, node):
+        return node in self.parent
+
+    def __len__(self):
+        return len(self.parent)
+
+    def set_inputs(self, inputs):
+        """Genes that were asked for, in order and without repeats"""
+        self.inputs = list(dict.fromkeys(inputs))
+
+    def add_node(self, node):
+        if node not in self.parent:
+            self.parent[node] = node
+            self.size[node] = 1
+            self.degrees[node] = 0
+
+    def find(self, node):
+        root = node
+
+        while self.parent[root] != root:
+            root = self.parent[root]
+
+        while self.parent[node] != root:
+            self.parent[node], node = root, self.parent[node]
+
+        return root
+
+    def add_edge(self, u, v):
+        self.add_node(u)
+        self.add_node(v)
+        self.degrees[u] += 1
+        self.degrees[v] += 1
+
+        ru = self.find(u)
+        rv = self.find(v)
+
+        if ru == rv:
+            return
+
+        if self.size[ru] < self.size[rv]:
+            ru, rv = rv, ru
+
+        self.parent[rv] = ru
+        self.size[ru] += self.size[rv]
+
+    def degree(self, node):
+        return self.degrees.get(node, 0)
+
+    def components(self):
+        """Lists of sorted node names, largest component first and ties
+        broken by first name so the order is deterministic"""
+        groups = dict()
+
+        for n in self.parent:
+            groups.setdefault(self.find(n), list()).append(n)
+
+        comps = [sorted(g) for g in groups.values()]
+
+        return sorted(comps, key=lambda c: (-len(c), c[0]))
+
+    def component_of(self, node):
+        root = self.find(node)
+        return sorted(n for n in self.parent if self.find(n) == root)
+
+    def isolated(self, inputs=None):
+        """Input genes that are not on any edge, in input order"""
+        if inputs is None:
+            inputs = self.inputs
+        else:
+            inputs = list(dict.fromkeys(inputs))
+
+        return [g for g in inputs if g not in self.parent]
+
+    def shared_leaves(self, centers, min_degree=2):
+        """Nodes other than 'centers' with at least 'min_degree' edges"""
+        centers = set(centers)
+
+        return [n for n, d in self.degrees.items()
+                if n not in centers and d >= min_degree]
+
+
+def label_propagation(edges, max_iter=20):
+    """Communities of (u, v, weight) edges by weighted label propagation.
+    Each node takes the label with the most edge weight among its
+    neighbours.  Nodes are visited in sorted order, a node keeps its label
+    on a tie and other ties go to the smallest label, so the result is
+    deterministic.  Self loops are ignored.  Returns a dictionary of node
+    to label, where a label is the name of a node in the community."""
+    adj = dict()
+
+    for u, v, w in edges:
+        if u == v:
+            continue
+
+        adj.setdefault(u, dict())
+        adj.setdefault(v, dict())
+        adj[u][v] = adj[u].get(v, 0) + w
+        adj[v][u] = adj[v].get(u, 0) + w
+
+    labels = {n: n for n in adj}
+    order = sorted(adj)
+
+    for i in range(max_iter):
+        changed = False
+
+        for n in order:
+            totals = dict()
+
+            for m, w in adj[n].items():
+                totals[labels[m]] = totals.get(labels[m], 0) + w
+
+            best = max(totals.values())
+
+            if totals.get(labels[n]) == best:
+                continue
+
+            labels[n] = min(l for l, t in totals.items() if t == best)
+            changed = True
+
+        if not changed:
+            break
+
+    return labels
+
+
+def communities(labels):
+    """Member lists from label_propagation, sorted, largest first and ties
+    broken by first name"""
+    groups = dict()
+
+    for n, l in labels.items():
+        groups.setdefault(l, list()).append(n)
+
+    return sorted((sorted(g) for g in groups.values()),
+            key=lambda c: (-len(c), c[0]))
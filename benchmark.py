@@ -0,0 +1,480 @@
+# Benchmark suite for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import concurrent.futures
+import functools
+import gzip
+import json
+import os
+import os.path
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+"""Synthetic STRING database generator and stage timings for SDBL"""
+
+__version__ = 1.0
+
+ALIAS_SOURCES = ("BLAST_UniProt_GN_Name", "Ensembl_MGI", "Ensembl_EntrezGene")
+
+STAGES = ("build_db", "alias", "actions_query", "evidence_query", "edges",
+          "expand_r1", "expand_r2", "expand_r3", "graph", "layout",
+          "colorize", "colorize_large", "draw")
+
+# Node count for the colorize_large stage
+LARGE_GRAPH_NODES = 5000
+
+# Seed genes and partners kept per hop for the expand_r* stages
+EXPANSION_SEEDS = 10
+EXPANSION_TOP_N = 25
+
+DRAW_FORMATS = ("png", "pdf", "svg")
+
+# Import statements for the query-only and DOT-only entry points, with the
+# wall clock budget in seconds for a fresh interpreter to run them.
+STARTUP_PATHS = {
+        "startup_query": ("import sql", 0.15),
+        "startup_dot": ("import sql, graph, sdbl", 0.40)
+        }
+
+HEAVY_MODULES = ("pandas", "matplotlib", "matplotlib.pyplot", "imageio")
+
+
+class SdblBenchmarkException(Exception):
+    pass
+
+
+def synthetic_protein_id(i, taxon=10090):
+    return "{}.ENSMUSP{:011d}".format(taxon, i)
+
+
+def synthetic_gene_name(i):
+    return "Gene{}".format(i)
+
+
+def synthetic_pairs(n_proteins, degree, rng):
+    """Random undirected protein pairs with a mean degree of roughly
+    'degree'.  Pairs are unique and never self-referencing."""
+    n_pairs = (n_proteins * degree) // 2
+    pairs = set()
+
+    while len(pairs) < n_pairs:
+        a = rng.randrange(n_proteins)
+        b = rng.randrange(n_proteins)
+
+        if a != b:
+            pairs.add((min(a, b), max(a, b)))
+
+    return sorted(pairs)
+
+
+def write_synthetic_stringdb(outdir, n_proteins=2000, degree=20, seed=12345,
+        taxon=10090):
+    """Write gzipped alias, detailed links and actions files shaped like the
+    string-db.org organism downloads.  Returns the three file names."""
+    rng = random.Random(seed)
+    os.makedirs(outdir, exist_ok=True)
+
+    alias_file = os.path.join(outdir, "{}.protein.aliases.synthetic.txt.gz".format(taxon))
+    evidence_file = os.path.join(outdir, "{}.protein.links.detailed.synthetic.txt.gz".format(taxon))
+    actions_file = os.path.join(outdir, "{}.protein.actions.synthetic.txt.gz".format(taxon))
+
+    with gzip.open(alias_file, mode="wt") as ofs:
+        ofs.write("## string_protein_id ## alias ## source ##\n")
+
+        for i in range(n_proteins):
+            p = synthetic_protein_id(i, taxon)
+            g = synthetic_gene_name(i)
+            ofs.write("{}\t{}\t{}\n".format(p, g, ALIAS_SOURCES[0]))
+            ofs.write("{}\t{}\t{}\n".format(p, g, ALIAS_SOURCES[1]))
+            ofs.write("{}\t{}\t{}\n".format(p, 100000 + i, ALIAS_SOURCES[2]))
+
+    pairs = synthetic_pairs(n_proteins, degree, rng)
+
+    with gzip.open(evidence_file, mode="wt") as ofs:
+        ofs.write("protein1 protein2 neighborhood fusion cooccurence "
+                  "coexpression experimental database textmining "
+                  "combined_score\n")
+
+        for a, b in pairs:
+            channels = [rng.choice((0, 0, 0, rng.randint(150, 999)))
+                        for _ in range(7)]
+            combined = max(channels + [rng.randint(150, 999)])
+            row = " ".join(str(c) for c in channels + [combined])
+            pa = synthetic_protein_id(a, taxon)
+            pb = synthetic_protein_id(b, taxon)
+            ofs.write("{} {} {}\n".format(pa, pb, row))
+            ofs.write("{} {} {}\n".format(pb, pa, row))
+
+    modes = ("activation", "binding", "catalysis", "expression",
+             "inhibition", "ptmod", "reaction")
+
+    with gzip.open(actions_file, mode="wt") as ofs:
+        ofs.write("item_id_a\titem_id_b\tmode\taction\tis_directional\t"
+                  "a_is_acting\tscore\n")
+
+        for a, b in pairs:
+            if rng.random() > 0.5:
+                continue
+
+            mode = rng.choice(modes)
+            directional = mode not in ("binding", "expression", "reaction")
+            action = mode if directional else ""
+            score = rng.randint(150, 999)
+            pa = synthetic_protein_id(a, taxon)
+            pb = synthetic_protein_id(b, taxon)
+            d = "t" if directional else "f"
+            ofs.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+                pa, pb, mode, action, d, "t" if directional else "f", score))
+            ofs.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+                pb, pa, mode, action, d, "f", score))
+
+    return alias_file, evidence_file, actions_file
+
+
+class SdblBenchmarkContext:
+    """State shared between benchmark stages"""
+
+    def __init__(self, workdir, n_proteins=2000, degree=20, n_genes=200,
+            cutoff=400, seed=12345):
+        self.workdir = workdir
+        self.n_proteins = n_proteins
+        self.degree = degree
+        self.cutoff = cutoff
+        self.seed = seed
+        self.dbfile = os.path.join(workdir, "synthetic_stringdb.db")
+        self.files = None
+
+        rng = random.Random(seed)
+        idx = rng.sample(range(n_proteins), min(n_genes, n_proteins))
+        self.gene_list = [synthetic_gene_name(i) for i in sorted(idx)]
+
+        self.sdbl = None
+        self.results = None
+
+    def generate(self):
+        self.files = write_synthetic_stringdb(self.workdir, self.n_proteins,
+                self.degree, self.seed)
+
+
+def stage_build_db(ctx):
+    import sql
+
+    if os.path.exists(ctx.dbfile):
+        os.remove(ctx.dbfile)
+
+    sql.build_sql_stringdb_database(*ctx.files, ctx.dbfile)
+
+
+def stage_alias(ctx):
+    import sql
+
+    dbh = sql.SdblSql(ctx.dbfile)
+    dbh.get_aliases(ctx.gene_list)
+    dbh.close()
+
+
+def stage_actions_query(ctx):
+    import sql
+
+    dbh = sql.SdblSql(ctx.dbfile)
+    dbh.actions_query_multiple_genes(ctx.gene_list, ctx.cutoff)
+    dbh.close()
+
+
+def stage_evidence_query(ctx):
+    import sql
+
+    dbh = sql.SdblSql(ctx.dbfile)
+    ctx.results = dbh.evidence_query_multiple_genes(ctx.gene_list, ctx.cutoff)
+    dbh.close()
+
+
+def stage_edges(ctx):
+    import edge_engine
+
+    ee = edge_engine.SdblEdgeEngine(ctx.results)
+    ee.generate_edges()
+
+
+def stage_expand(ctx, radius):
+    import sql
+
+    dbh = sql.SdblSql(ctx.dbfile)
+    dbh.neighborhood_query(ctx.gene_list[:EXPANSION_SEEDS], radius,
+            ctx.cutoff, schema="evidence", top_n=EXPANSION_TOP_N)
+    dbh.close()
+
+
+def stage_graph(ctx):
+    import sdbl
+
+    ctx.sdbl = sdbl.Sdbl(ctx.dbfile)
+    ctx.sdbl.build_evidence_graph(ctx.gene_list, ctx.cutoff,
+            modes=["database", "experimental"])
+
+
+def stage_layout(ctx):
+    ctx.sdbl.layout(prog="sfdp")
+    ctx.sdbl.add_disconnected_right()
+
+
+def stage_colorize(ctx):
+    import pandas as pd
+
+    rng = random.Random(ctx.seed)
+    nodes = sorted(ctx.sdbl.nodes() or [])
+    frame = pd.DataFrame({"value": [rng.uniform(-1, 1) for _ in nodes]},
+            index=nodes)
+    ctx.sdbl.colorize_by_column(frame, "value")
+
+
+def stage_colorize_large(ctx):
+    import matplotlib.cm
+    import numpy as np
+    import pandas as pd
+    import pygraphviz
+    import colormap
+
+    rng = np.random.RandomState(ctx.seed)
+    nodes = ["Node{}".format(i) for i in range(LARGE_GRAPH_NODES)]
+    A = pygraphviz.AGraph(strict=False)
+    A.add_nodes_from(nodes)
+    A.add_edges_from(zip(nodes[:-1], nodes[1:]))
+    series = pd.Series(rng.normal(size=len(nodes)), index=nodes)
+
+    cm = colormap.SdblDivergingColormap(matplotlib.cm.Blues,
+            matplotlib.cm.Oranges)
+    bins = colormap.diverging_quantile_bins(series, 0.0, 3)
+    colorizer = colormap.SdblNodeColorizer.from_colormap(cm,
+            fontcolors=("black", "white"))
+    colorizer.apply(A, series, bins)
+    A.close()
+
+
+def stage_draw(ctx):
+    for ext in DRAW_FORMATS:
+        ctx.sdbl.draw(os.path.join(ctx.workdir, "synthetic.{}".format(ext)))
+
+
+STAGE_FUNCTIONS = {
+        "build_db": stage_build_db,
+        "alias": stage_alias,
+        "actions_query": stage_actions_query,
+        "evidence_query": stage_evidence_query,
+        "edges": stage_edges,
+        "expand_r1": functools.partial(stage_expand, radius=1),
+        "expand_r2": functools.partial(stage_expand, radius=2),
+        "expand_r3": functools.partial(stage_expand, radius=3),
+        "graph": stage_graph,
+        "layout": stage_layout,
+        "colorize": stage_colorize,
+        "colorize_large": stage_colorize_large,
+        "draw": stage_draw
+        }
+
+
+def setup_edges(ctx):
+    if ctx.results is None:
+        stage_evidence_query(ctx)
+
+
+def setup_laid_out(ctx):
+    if ctx.sdbl is None or not ctx.sdbl.G.gobj.has_layout:
+        stage_graph(ctx)
+        stage_layout(ctx)
+
+
+# Untimed setup run before each timed run of a stage, so that a stage's
+# timing covers only its own work.  layout gets a fresh graph every run.
+STAGE_SETUP = {
+        "edges": setup_edges,
+        "layout": stage_graph,
+        "colorize": setup_laid_out,
+        "draw": setup_laid_out
+        }
+
+
+def time_stage(func, ctx, repeat=3, setup=None):
+    runs = list()
+
+    for i in range(repeat):
+        if setup is not None:
+            setup(ctx)
+
+        t0 = time.perf_counter()
+        func(ctx)
+        runs.append(time.perf_counter() - t0)
+
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def run_benchmarks(ctx, stages=STAGES, repeat=3, verbose=False):
+    """Time each requested stage.  The database is always built once before
+    any query stage so that stages may be run in isolation."""
+    ctx.generate()
+
+    if "build_db" not in stages:
+        stage_build_db(ctx)
+
+    result = {
+            "meta": {
+                "version": __version__,
+                "proteins": ctx.n_proteins,
+                "degree": ctx.degree,
+                "genes": len(ctx.gene_list),
+                "cutoff": ctx.cutoff,
+                "seed": ctx.seed,
+                "repeat": repeat
+                },
+            "stages": dict()
+            }
+
+    for name in stages:
+        if name not in STAGE_FUNCTIONS:
+            estr = "Unknown benchmark stage: {}".format(name)
+            raise SdblBenchmarkException(estr)
+
+        if verbose:
+            print("Timing {}".format(name), end="...", flush=True)
+
+        result["stages"][name] = time_stage(STAGE_FUNCTIONS[name], ctx,
+                repeat=repeat, setup=STAGE_SETUP.get(name))
+
+        if verbose:
+            print("{:.4f}s".format(result["stages"][name]["median"]))
+
+    return result
+
+
+def time_startup(statement, repeat=5, python=sys.executable):
+    """Time a fresh interpreter running 'statement' with this directory on
+    its path.  Returns the timings and any heavy modules it loaded."""
+    moddir = os.path.dirname(os.path.abspath(__file__))
+    check = "{}; import sys; print(','.join(m for m in {!r} if m in sys.modules))".format(
+            statement, HEAVY_MODULES)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, (moddir,
+        env.get("PYTHONPATH"))))
+    runs = list()
+    loaded = ""
+
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        proc = subprocess.run([python, "-c", check], env=env,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        runs.append(time.perf_counter() - t0)
+        loaded = proc.stdout.decode("utf-8").strip()
+
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs,
+            "heavy_modules": [m for m in loaded.split(",") if m]}
+
+
+def run_startup_benchmarks(result, repeat=5, verbose=False):
+    """Add startup timings for each entry point to 'result'.  Returns the
+    names of the paths that are over budget or load a heavy module."""
+    failed = list()
+
+    for name, (statement, budget) in STARTUP_PATHS.items():
+        if verbose:
+            print("Timing {}".format(name), end="...", flush=True)
+
+        timing = time_startup(statement, repeat=repeat)
+        timing["budget"] = budget
+        result["stages"][name] = timing
+
+        if timing["min"] > budget or timing["heavy_modules"]:
+            failed.append(name)
+
+        if verbose:
+            print("{:.4f}s (budget {:.2f}s) {}".format(timing["min"], budget,
+                " ".join(timing["heavy_modules"])))
+
+    return failed
+
+
+def stress_queries(ctx, threads=8, jobs=200, genes_per_job=25, verbose=False):
+    """Run overlapping queries of both schemas on one SdblSql from a
+    thread pool, and through SdblSql.batch_query, and compare every result
+    with a serial run on another.  Returns timings and the number of
+    mismatched results."""
+    import sql
+
+    rng = random.Random(ctx.seed)
+    work = list()
+
+    for i in range(jobs):
+        gl = rng.sample(ctx.gene_list, min(genes_per_job, len(ctx.gene_list)))
+        work.append((rng.choice(("action", "evidence")), gl))
+
+    def run(dbh, schema, gl):
+        if schema == "action":
+            return dbh.actions_query_multiple_genes(gl, ctx.cutoff)
+
+        return dbh.evidence_query_multiple_genes(gl, ctx.cutoff)
+
+    serial = sql.SdblSql(ctx.dbfile)
+    t0 = time.perf_counter()
+    expected = [run(serial, schema, gl) for schema, gl in work]
+    serial_time = time.perf_counter() - t0
+    serial.close()
+
+    shared = sql.SdblSql(ctx.dbfile)
+    t0 = time.perf_counter()
+
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        futures = [pool.submit(run, shared, schema, gl) for schema, gl in work]
+        results = [f.result() for f in futures]
+
+    thread_time = time.perf_counter() - t0
+
+    batch = shared.batch_query([gl for schema, gl in work], ctx.cutoff,
+            schema="evidence", threads=threads)
+    shared.close()
+
+    mismatches = sum(1 for a, b in zip(results, expected) if a != b)
+    mismatches += sum(1 for (schema, gl), a, b in zip(work, batch, expected)
+            if schema == "evidence" and a != b)
+
+    stress = {"jobs": jobs, "threads": threads, "serial": serial_time,
+              "threaded": thread_time, "mismatches": mismatches}
+
+    if verbose:
+        print("Stress: {} jobs on {} threads, {:.4f}s serial, {:.4f}s "
+                "threaded, {} mismatches".format(jobs, threads, serial_time,
+                    thread_time, mismatches))
+
+    return stress
+
+
+def write_results(result, filename):
+    with open(filename, "w") as ofs:
+        json.dump(result, ofs, indent=2, sort_keys=True)
+
+
+def read_results(filename):
+    with open(filename) as ifs:
+        return json.load(ifs)
+
+
+def compare_results(current, baseline, tolerance=0.25, min_delta=0.005):
+    """Compare median stage timings against a baseline.  A stage regresses
+    when it is more than 'tolerance' slower and at least 'min_delta'
+    seconds slower.  Returns a list of (stage, baseline, current, ratio,
+    regressed) tuples."""
+    report = list()
+
+    for name, cur in sorted(current["stages"].items()):
+        if name not in baseline["stages"]:
+            continue
+
+        old = baseline["stages"][name]["median"]
+        new = cur["median"]
+        ratio = new / old if old > 0 else float("inf")
+        regressed = ratio > 1.0 + tolerance and new - old > min_delta
+        report.append((name, old, new, ratio, regressed))
+
+    return report
@@ -2,7 +2,12 @@
 # Author: Henry Amrhein
 # Date: 16 OCT 2019
 
-import matplotlib.pyplot as plt
+import collections
+import contextlib
+import hashlib
+import threading
+
+import matplotlib.cm
 import matplotlib.colors as colors
 import numpy as np
 
@@ -10,27 +15,137 @@ import numpy as np
 
 __version__ = 1.0
 
+LUMINANCE_WEIGHTS = (0.299, 0.587, 0.114, 0.0)
+
+PALETTE_CACHE_SIZE = 512
+
 
 class SdblColormapException(Exception):
     pass
 
 
-class SdblColormapComponent:
+class SdblPalette:
+    """Sampled colours of a colormap with their hex strings and luminance.
+    The arrays are read-only because palettes are shared through the
+    cache."""
+    __slots__ = ["colors", "hex_list", "luminance"]
+
+    def __init__(self, color_list):
+        self.colors = color_list
+        self.hex_list = tuple(colors.to_hex(c) for c in color_list)
+        self.luminance = np.sum(color_list * LUMINANCE_WEIGHTS, axis=1)
+        self.colors.flags.writeable = False
+        self.luminance.flags.writeable = False
+
+
+class SdblPaletteCache:
+    """Process-wide LRU cache of palettes keyed by (colormap, lower stop,
+    upper stop, bins)"""
+
+    def __init__(self, maxsize=PALETTE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, cmap, cmap_key, lstop, ustop, nbins):
+        key = (cmap_key, float(lstop), float(ustop), int(nbins))
+
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        palette = SdblPalette(cmap(np.linspace(lstop, ustop, nbins)))
+
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = palette
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        return palette
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+PALETTE_CACHE = SdblPaletteCache()
+
+
+def colormap_key(cmap):
+    """Cache key for a matplotlib colormap.  Colormaps built on the fly
+    often share a name, so the key includes a digest of the lookup table."""
+    lut = np.ascontiguousarray(cmap(np.linspace(0, 1, cmap.N)))
+    return (cmap.name, cmap.N, hashlib.sha1(lut.tobytes()).hexdigest())
+
+
+class SdblBatchRefresh:
+    """Defers _rebuild while inside batch().  Subclasses implement
+    _rebuild and list the objects to batch along with them in
+    _children."""
+
+    _children = ()
+
+    def __init__(self):
+        self._deferred = 0
+        self._dirty = False
+
+    def _refresh(self):
+        if self._deferred:
+            self._dirty = True
+            return
+
+        self._rebuild()
+
+        if self.parent is not None:
+            self.parent._refresh()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Apply several changes with a single refresh at the end"""
+        with contextlib.ExitStack() as stack:
+            self._deferred += 1
+
+            for child in self._children:
+                stack.enter_context(child.batch())
+
+            try:
+                yield self
+            finally:
+                stack.close()
+                self._deferred -= 1
+
+        if self._deferred == 0 and self._dirty:
+            self._dirty = False
+            self._refresh()
+
+
+class SdblColormapComponent(SdblBatchRefresh):
     def __init__(self, cmap, parent=None):
+        SdblBatchRefresh.__init__(self)
         self.cmap = cmap
+        self.cmap_key = colormap_key(cmap)
         self.parent = parent
         self.nbins = 3
         self.lstop = 0.3
         self.ustop = 0.8
-        self.color_list = self.cmap(np.linspace(self.lstop, self.ustop, self.nbins))
-        self.lum_list = np.sum(self.color_list * (0.299, 0.587, 0.114, 0.0), axis=1)
-
-    def _refresh(self):
-        self.color_list = self.cmap(np.linspace(self.lstop, self.ustop, self.nbins))
-        self.lum_list = np.sum(self.color_list * (0.299, 0.587, 0.114, 0.0), axis=1)
+        self._rebuild()
 
-        if self.parent is not None:
-            self.parent._refresh()
+    def _rebuild(self):
+        self.palette = PALETTE_CACHE.get(self.cmap, self.cmap_key, self.lstop,
+                self.ustop, self.nbins)
+        self.color_list = self.palette.colors
+        self.lum_list = self.palette.luminance
 
     def __len__(self):
         return self.nbins
@@ -62,6 +177,22 @@ class SdblColormapComponent:
         self.nbins = value
         self._refresh()
 
+    @property
+    def hex_list(self):
+        return self.palette.hex_list
+
+    def configure(self, lower_stop=None, upper_stop=None, n_quantiles=None):
+        """Set any of the stops and the number of bins with one refresh"""
+        with self.batch():
+            if lower_stop is not None:
+                self.lower_stop = lower_stop
+
+            if upper_stop is not None:
+                self.upper_stop = upper_stop
+
+            if n_quantiles is not None:
+                self.n_quantiles = n_quantiles
+
     def reverse(self):
         lower = self.lstop
         self.lstop = self.ustop
@@ -69,28 +200,25 @@ class SdblColormapComponent:
         self._refresh()
 
 
-class SdblDivergingColormap:
+class SdblDivergingColormap(SdblBatchRefresh):
     def __init__(self, colormap0, colormap1, parent=None):
+        SdblBatchRefresh.__init__(self)
         self.component0 = SdblColormapComponent(colormap0, self)
         self.component1 = SdblColormapComponent(colormap1, self)
         self.parent = parent
         self.component0.reverse()
-        self.cmap = colors.ListedColormap(np.vstack((
-            self.component0.color_list,
-            self.component1.color_list
-            ))
-        )
 
-    def _refresh(self):
+    @property
+    def _children(self):
+        return (self.component0, self.component1)
+
+    def _rebuild(self):
         self.cmap = colors.ListedColormap(np.vstack((
             self.component0.color_list,
             self.component1.color_list
             ))
         )
 
-        if self.parent is not None:
-            self.parent._refresh()
-
     @property
     def N(self):
         return self.cmap.N
@@ -99,25 +227,31 @@ class SdblDivergingColormap:
     def color_list(self):
         return self.cmap.colors
 
+    @property
+    def hex_list(self):
+        return self.component0.hex_list + self.component1.hex_list
+
     @property
     def luminance_list(self):
-        return np.sum(self.cmap.colors * (0.299, 0.587, 0.114, 0.0), axis=1)
+        return np.sum(self.cmap.colors * LUMINANCE_WEIGHTS, axis=1)
 
     def __call__(self, value):
         return self.cmap(value)
 
 
-class SdblLinearColormap:
+class SdblLinearColormap(SdblBatchRefresh):
     def __init__(self, colormap0, parent=None):
+        SdblBatchRefresh.__init__(self)
         self.component = SdblColormapComponent(colormap0, self)
         self.parent = parent
-        self.cmap = colors.ListedColormap(self.component.color_list)
+        self._rebuild()
 
-    def _refresh(self):
+    @property
+    def _children(self):
+        return (self.component,)
+
+    def _rebuild(self):
         self.cmap = colors.ListedColormap(self.component.color_list)
-        
-        if self.parent is not None:
-            self.parent._refresh()
 
     @property
     def N(self):
@@ -127,9 +261,13 @@ class SdblLinearColormap:
     def color_list(self):
         return self.cmap.colors
 
+    @property
+    def hex_list(self):
+        return self.component.hex_list
+
     @property
     def luminance_list(self):
-        return np.sum(self.cmap.colors * (0.299, 0.587, 0.114, 0.0), axis=1)
+        return np.sum(self.cmap.colors * LUMINANCE_WEIGHTS, axis=1)
 
     def __call__(self, value):
         return self.cmap(value)
@@ -139,50 +277,125 @@ def hex_colorlist(cmap):
     return [colors.to_hex(c) for c in cmap.color_list]
 
 
-def sdbl_quantile_diverging_colorize_by_numeric_series(O, series,
-        cool_cm=plt.cm.Blues, warm_cm=plt.cm.Oranges, center=0.0,
-        cm_lower_stop=0.3, cm_upper_stop=0.8, n_quantiles=3):
+def node_agraph(obj):
+    """Return the pygraphviz AGraph behind an Sdbl, SdblGraph or AGraph"""
+    if hasattr(obj, "G"):
+        return obj.G.gobj
 
-    cmap = SdblDivergingColormap(cool_cm, warm_cm)
+    if hasattr(obj, "gobj"):
+        return obj.gobj
+
+    if hasattr(obj, "A"):
+        return obj.A
 
-    cmap.component0.upper_stop = cm_lower_stop
-    cmap.component0.lower_stop = cm_upper_stop
-    cmap.component0.n_quantiles = n_quantiles
+    return obj
 
-    cmap.component1.lower_stop = cm_lower_stop
-    cmap.component1.upper_stop = cm_upper_stop
-    cmap.component1.n_quantiles = n_quantiles
 
+def diverging_quantile_bins(series, center=0.0, n_quantiles=3):
+    """Quantile bin edges below and above 'center', with 'center' itself as
+    the middle edge"""
     qspace = np.linspace(0, 1, n_quantiles + 1)
     dnq = series[series < center].quantile(qspace[:n_quantiles])
     upq = series[series > center].quantile(qspace[1:])
 
-    bins = np.concatenate([dnq, [center], upq])
+    return np.concatenate([dnq, [center], upq])
+
+
+def linear_quantile_bins(series, n_quantiles=3):
+    return series.quantile(np.linspace(0, 1, n_quantiles)).values
+
+
+class SdblNodeColorizer:
+    """Fill (and optionally font) colours for graph nodes by bin.
 
-    color_idx = np.digitize(series, bins) - 1
+    The hex palette, luminance and font colour for every bin are computed
+    once from 'color_list', unless the hex strings are passed in as
+    'hex_list'; from_colormap takes them from the cached palettes.  Values
+    are binned in one np.digitize call and the attributes are then written
+    node by node with a single update."""
 
-    for n, c in zip(series.index, color_idx):
-        if n in O.A:
-            attr = O.A.get_node(n).attr
-            attr["style"] = "filled"
-            attr["fillcolor"] = colors.to_hex(cmap(c))
+    def __init__(self, color_list, fontcolors=None, threshold=0.55,
+            hex_list=None):
+        rgba = colors.to_rgba_array(color_list)
+
+        if hex_list is None:
+            hex_list = [colors.to_hex(c) for c in rgba]
+
+        self.hex_list = np.array(hex_list)
+        self.lum_list = np.sum(rgba * LUMINANCE_WEIGHTS, axis=1)
+
+        if fontcolors is None:
+            self.font_list = None
+        else:
+            self.font_list = np.where(self.lum_list < threshold,
+                    fontcolors[1], fontcolors[0])
+
+    @classmethod
+    def from_colormap(cls, cmap, fontcolors=None, threshold=0.55):
+        """Colorizer for an SdblLinearColormap or SdblDivergingColormap"""
+        return cls(cmap.color_list, fontcolors=fontcolors,
+                threshold=threshold, hex_list=cmap.hex_list)
+
+    def __len__(self):
+        return len(self.hex_list)
+
+    def indices(self, values, bins):
+        """Palette index for each value.  Values outside the bins take the
+        first or last colour, as a ListedColormap would."""
+        idx = np.digitize(values, bins) - 1
+        return np.clip(idx, 0, len(self.hex_list) - 1)
+
+    def attributes(self, series, bins):
+        """(node, attribute dict) for every entry in 'series'"""
+        idx = self.indices(series, bins)
+        fills = self.hex_list[idx]
+
+        if self.font_list is None:
+            return [(n, {"style": "filled", "fillcolor": f})
+                    for n, f in zip(series.index, fills)]
+
+        fonts = self.font_list[idx]
+
+        return [(n, {"style": "filled", "fillcolor": f, "fontcolor": t})
+                for n, f, t in zip(series.index, fills, fonts)]
+
+    def apply(self, O, series, bins):
+        """Colour the nodes of O named in 'series'.  Names that are not in
+        the graph are skipped.  Returns the number of nodes coloured."""
+        A = node_agraph(O)
+        n_colored = 0
+
+        for n, attr in self.attributes(series, bins):
+            if n in A:
+                A.get_node(n).attr.update(attr)
+                n_colored += 1
+
+        return n_colored
+
+
+def sdbl_quantile_diverging_colorize_by_numeric_series(O, series,
+        cool_cm=matplotlib.cm.Blues, warm_cm=matplotlib.cm.Oranges, center=0.0,
+        cm_lower_stop=0.3, cm_upper_stop=0.8, n_quantiles=3):
+
+    cmap = SdblDivergingColormap(cool_cm, warm_cm)
+
+    with cmap.batch():
+        cmap.component0.configure(lower_stop=cm_upper_stop,
+                upper_stop=cm_lower_stop, n_quantiles=n_quantiles)
+        cmap.component1.configure(lower_stop=cm_lower_stop,
+                upper_stop=cm_upper_stop, n_quantiles=n_quantiles)
+
+    bins = diverging_quantile_bins(series, center, n_quantiles)
+    SdblNodeColorizer.from_colormap(cmap).apply(O, series, bins)
 
 
 def sdbl_quantile_linear_colorize_by_numeric_series(O, series,
-        cm=plt.cm.Blues, cm_lower_stop=0.3, cm_upper_stop=0.8,
+        cm=matplotlib.cm.Blues, cm_lower_stop=0.3, cm_upper_stop=0.8,
         n_quantiles=3):
 
     cmap = SdblLinearColormap(cm)
+    cmap.component.configure(lower_stop=cm_lower_stop,
+            upper_stop=cm_upper_stop, n_quantiles=n_quantiles)
 
-    cmap.component.lower_stop = cm_lower_stop
-    cmap.component.upper_stop = cm_upper_stop
-    cmap.component.n_quantiles = n_quantiles
-
-    qspace = np.linspace(0, 1, n_quantiles)
-    color_idx = np.digitize(series, series.quantile(qspace)) - 1
-
-    for n, c in zip(series.index, color_idx):
-        if n in O.A:
-            attr = O.A.get_node(n).attr
-            attr["style"] = "filled"
-            attr["fillcolor"] = colors.to_hex(cmap(c))
+    bins = linear_quantile_bins(series, n_quantiles)
+    SdblNodeColorizer.from_colormap(cmap).apply(O, series, bins)
@@ -1,3 +1,5 @@
+import instrument
+
 
 ACTION_MODES = ("activation", "binding", "catalysis", "expression", "inhibition", "ptmod", "reaction")
 
@@ -28,8 +30,9 @@ class SdblEdgeProperty:
 class SdblEdgeEngine:
     NON_DIRECTIONAL = ("binding", "expression", "reaction")
 
-    def __init__(self, db_results):
+    def __init__(self, db_results, report=None):
         self.edges = dict()
+        self.report = instrument.report_or_null(report)
         self.db_results = db_results
         weights = [r[-1] for r in db_results]
         self.min_weight = min(weights)
@@ -73,13 +76,52 @@ class SdblEdgeEngine:
         return SdblEdgeProperty(score, arrowtype, direction, penwidth)
 
     def generate_edges(self):
-        for res in self.db_results:
-            key = tuple(sorted([res[0], res[1]]) + [res[2]])
+        with self.report.stage("edge_engine"):
+            for res in self.db_results:
+                key = tuple(sorted([res[0], res[1]]) + [res[2]])
 
-            if key not in self.edges:
-                self.edges[key] = self.edge_property_factory(res)
-            else:
-                self.edges[key] += self.edge_property_factory(res)
+                if key not in self.edges:
+                    self.edges[key] = self.edge_property_factory(res)
+                else:
+                    self.edges[key] += self.edge_property_factory(res)
+
+        self.report.count("edges_generated", len(self.edges))
+
+    def sparsify(self, k, per_mode=False, modes=None):
+        """Keep the k highest scoring edges at each node, counted for each
+        mode separately when per_mode is set.  An edge stays when it is in
+        the top k at either end, which bounds the edge count at k times the
+        node count.  Self loops and edges outside 'modes' are left alone.
+        Returns the number of edges removed."""
+        if len(self.edges) == 0:
+            self.generate_edges()
+
+        ranked = sorted((key for key in self.edges if key[0] != key[1] and
+                (modes is None or key[2] in modes)),
+                key=lambda key: (-self.edges[key].score, key))
+        taken = dict()
+        removed = list()
+
+        for key in ranked:
+            keep = False
+
+            for node in key[:2]:
+                slot = (node, key[2]) if per_mode else node
+                n = taken.get(slot, 0)
+
+                if n < k:
+                    taken[slot] = n + 1
+                    keep = True
+
+            if not keep:
+                removed.append(key)
+
+        for key in removed:
+            del self.edges[key]
+
+        self.report.count("edges_pruned", len(removed))
+
+        return len(removed)
 
     def __iter__(self):
         if len(self.edges) == 0:
@@ -0,0 +1,355 @@
+# Graph exporters for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import contextlib
+import csv
+import json
+import struct
+import xml.sax.saxutils
+
+import numpy as np
+
+"""Streaming edge list, GraphML, JSON and columnar exports of SDBL edges"""
+
+__version__ = 1.0
+
+EDGE_FIELDS = ("source", "target", "mode", "score", "direction", "arrowtype",
+               "penwidth")
+
+# Edges per chunk in the columnar format
+COLUMNAR_CHUNK = 65536
+
+COLUMNAR_MAGIC = b"SDBLCOL1"
+
+# Column types in EDGE_FIELDS order
+COLUMNAR_DTYPES = ("<i4", "<i4", "<u2", "<f8", "u1", "u1", "<f8")
+
+COLUMNAR_DIRECTIONS = ("none", "forward", "back", "both")
+
+COLUMNAR_ARROWTYPES = ("none", "normal", "tee")
+
+
+class SdblExportException(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def open_target(target, mode="w"):
+    """Open 'target' if it is a filename, otherwise use it as a file"""
+    if isinstance(target, str):
+        kwargs = {"newline": ""} if "b" not in mode else dict()
+
+        with open(target, mode, **kwargs) as ofs:
+            yield ofs
+    else:
+        yield target
+
+
+def node_columns(node_attrs):
+    """Sorted attribute names used by any node"""
+    if node_attrs is None:
+        return list()
+
+    return sorted({k for a in node_attrs.values() for k in a})
+
+
+def edge_row(key, prop):
+    return (key[0], key[1], key[2], prop.score, prop.direction,
+            prop.arrowtype, prop.penwidth)
+
+
+def write_edge_list(edges, target, delimiter="\t", node_attrs=None):
+    """One row per edge with a header.  'edges' are (key, SdblEdgeProperty)
+    pairs, such as an SdblEdgeEngine or SdblGraph.edge_data.items(), and
+    rows are written as they are read.  Attributes from 'node_attrs' (node
+    name to dictionary) are added as source_<name> and target_<name>
+    columns.  Returns the number of edges written."""
+    columns = node_columns(node_attrs)
+    n = 0
+
+    with open_target(target) as ofs:
+        writer = csv.writer(ofs, delimiter=delimiter, lineterminator="\n")
+        writer.writerow(EDGE_FIELDS + tuple("source_" + c for c in columns)
+                + tuple("target_" + c for c in columns))
+
+        for key, prop in edges:
+            row = edge_row(key, prop)
+
+            if len(columns) > 0:
+                a = node_attrs.get(key[0], dict())
+                b = node_attrs.get(key[1], dict())
+                row += tuple(a.get(c, "") for c in columns)
+                row += tuple(b.get(c, "") for c in columns)
+
+            writer.writerow(row)
+            n += 1
+
+    return n
+
+
+def write_tsv(edges, target, node_attrs=None):
+    return write_edge_list(edges, target, "\t", node_attrs)
+
+
+def write_csv(edges, target, node_attrs=None):
+    return write_edge_list(edges, target, ",", node_attrs)
+
+
+def graphml_type(values):
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool)
+            for v in values):
+        return "double"
+
+    return "string"
+
+
+def write_graphml(edges, target, node_attrs=None, directed=False):
+    """GraphML with edges streamed first and then every node seen, plus
+    any nodes in 'node_attrs' that are on no edge"""
+    columns = node_columns(node_attrs)
+    quote = xml.sax.saxutils.quoteattr
+    escape = xml.sax.saxutils.escape
+    seen = dict()
+    n = 0
+
+    with open_target(target) as ofs:
+        ofs.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        ofs.write('<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n')
+
+        for i, f in enumerate(EDGE_FIELDS[2:]):
+            t = "double" if f in ("score", "penwidth") else "string"
+            ofs.write('  <key id="e{}" for="edge" attr.name="{}" '
+                    'attr.type="{}"/>\n'.format(i, f, t))
+
+        for i, c in enumerate(columns):
+            t = graphml_type([a[c] for a in node_attrs.values() if c in a])
+            ofs.write('  <key id="n{}" for="node" attr.name={} '
+                    'attr.type="{}"/>\n'.format(i, quote(c), t))
+
+        ofs.write('  <graph edgedefault="{}">\n'.format(
+            "directed" if directed else "undirected"))
+
+        for key, prop in edges:
+            row = edge_row(key, prop)
+            ofs.write('    <edge source={} target={}>'.format(
+                quote(str(key[0])), quote(str(key[1]))))
+
+            for i, v in enumerate(row[2:]):
+                ofs.write('<data key="e{}">{}</data>'.format(i,
+                    escape(str(v))))
+
+            ofs.write('</edge>\n')
+            seen[key[0]] = None
+            seen[key[1]] = None
+            n += 1
+
+        if node_attrs is not None:
+            for name in node_attrs:
+                seen[name] = None
+
+        for name in seen:
+            attrs = node_attrs.get(name, dict()) if node_attrs else dict()
+            ofs.write('    <node id={}>'.format(quote(str(name))))
+
+            for i, c in enumerate(columns):
+                if c in attrs:
+                    ofs.write('<data key="n{}">{}</data>'.format(i,
+                        escape(str(attrs[c]))))
+
+            ofs.write('</node>\n')
+
+        ofs.write('  </graph>\n</graphml>\n')
+
+    return n
+
+
+def json_value(v):
+    """Numpy scalars as plain Python values"""
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def write_node_link(edges, target, node_attrs=None, directed=False):
+    """JSON in the node-link layout used by networkx.  The links are
+    written first, as they are read, and the nodes after them."""
+    seen = dict()
+    n = 0
+
+    with open_target(target) as ofs:
+        ofs.write('{{"directed": {}, "multigraph": true, "graph": {{}}, '
+                '"links": ['.format(json.dumps(directed)))
+
+        for key, prop in edges:
+            row = edge_row(key, prop)
+            link = {"source": key[0], "target": key[1], "key": key[2]}
+            link.update((f, json_value(v)) for f, v in
+                    zip(EDGE_FIELDS[2:], row[2:]))
+
+            ofs.write((",\n" if n else "\n") + json.dumps(link))
+            seen[key[0]] = None
+            seen[key[1]] = None
+            n += 1
+
+        ofs.write('],\n"nodes": [')
+
+        if node_attrs is not None:
+            for name in node_attrs:
+                seen[name] = None
+
+        for i, name in enumerate(seen):
+            node = {"id": name}
+
+            if node_attrs is not None:
+                node.update((k, json_value(v)) for k, v in
+                        node_attrs.get(name, dict()).items())
+
+            ofs.write((",\n" if i else "\n") + json.dumps(node))
+
+        ofs.write("]}\n")
+
+    return n
+
+
+def _code(table, value):
+    try:
+        return table.index(value)
+    except ValueError:
+        estr = "Can't store {!r} in the columnar format".format(value)
+        raise SdblExportException(estr)
+
+
+def write_columnar(edges, target, node_attrs=None, chunk=COLUMNAR_CHUNK):
+    """Binary columnar format written in chunks of 'chunk' edges.
+
+    After the magic bytes, each chunk is its edge count (uint32) followed
+    by the source and target node numbers (int32), mode number (uint16),
+    score (float64), direction and arrowtype codes (uint8) and penwidth
+    (float64) columns, little endian, and a count of 0 ends them.  A JSON
+    footer holds the node names, modes, code tables and node attributes,
+    followed by its length (uint64) and the magic bytes again.  Memory use
+    grows with the number of nodes but not of edges.  Read it with
+    read_columnar."""
+    nodes = dict()
+    modes = dict()
+    n = 0
+
+    def flush(ofs, buf):
+        ofs.write(struct.pack("<I", len(buf[0])))
+
+        for values, dtype in zip(buf, COLUMNAR_DTYPES):
+            ofs.write(np.asarray(values, dtype=dtype).tobytes())
+
+    with open_target(target, "wb") as ofs:
+        ofs.write(COLUMNAR_MAGIC)
+        buf = [list() for f in EDGE_FIELDS]
+
+        for key, prop in edges:
+            buf[0].append(nodes.setdefault(key[0], len(nodes)))
+            buf[1].append(nodes.setdefault(key[1], len(nodes)))
+            buf[2].append(modes.setdefault(key[2], len(modes)))
+            buf[3].append(prop.score)
+            buf[4].append(_code(COLUMNAR_DIRECTIONS, prop.direction))
+            buf[5].append(_code(COLUMNAR_ARROWTYPES, prop.arrowtype))
+            buf[6].append(prop.penwidth)
+            n += 1
+
+            if len(buf[0]) == chunk:
+                flush(ofs, buf)
+                buf = [list() for f in EDGE_FIELDS]
+
+        if len(buf[0]) > 0:
+            flush(ofs, buf)
+
+        if node_attrs is not None:
+            for name in node_attrs:
+                nodes.setdefault(name, len(nodes))
+
+        footer = {"version": 1,
+                  "edges": n,
+                  "nodes": list(nodes),
+                  "modes": list(modes),
+                  "directions": COLUMNAR_DIRECTIONS,
+                  "arrowtypes": COLUMNAR_ARROWTYPES,
+                  "node_attrs": {k: {a: json_value(v) for a, v in d.items()}
+                                 for k, d in node_attrs.items()}
+                                 if node_attrs else dict()}
+        data = json.dumps(footer).encode("utf-8")
+
+        # a chunk of no edges ends the chunks
+        ofs.write(struct.pack("<I", 0))
+        ofs.write(data)
+        ofs.write(struct.pack("<Q", len(data)))
+        ofs.write(COLUMNAR_MAGIC)
+
+    return n
+
+
+def read_columnar_footer(ifs):
+    ifs.seek(-16, 2)
+    size = struct.unpack("<Q", ifs.read(8))[0]
+
+    if ifs.read(8) != COLUMNAR_MAGIC:
+        estr = "Not an SDBL columnar file"
+        raise SdblExportException(estr)
+
+    ifs.seek(-16 - size, 2)
+
+    return json.loads(ifs.read(size).decode("utf-8"))
+
+
+def iter_columnar(filename):
+    """Yield one dictionary of column arrays per chunk"""
+    with open(filename, "rb") as ifs:
+        if ifs.read(8) != COLUMNAR_MAGIC:
+            estr = "Not an SDBL columnar file"
+            raise SdblExportException(estr)
+
+        while True:
+            n = struct.unpack("<I", ifs.read(4))[0]
+
+            if n == 0:
+                break
+
+            chunk = dict()
+
+            for f, dtype in zip(EDGE_FIELDS, COLUMNAR_DTYPES):
+                dt = np.dtype(dtype)
+                chunk[f] = np.frombuffer(ifs.read(n * dt.itemsize), dtype=dt)
+
+            yield chunk
+
+
+def read_columnar(filename):
+    """Whole columnar file as (columns, footer).  Columns hold node and
+    mode numbers; footer["nodes"] and footer["modes"] name them."""
+    with open(filename, "rb") as ifs:
+        footer = read_columnar_footer(ifs)
+
+    chunks = list(iter_columnar(filename))
+    columns = dict()
+
+    for f, dtype in zip(EDGE_FIELDS, COLUMNAR_DTYPES):
+        if len(chunks) > 0:
+            columns[f] = np.concatenate([c[f] for c in chunks])
+        else:
+            columns[f] = np.zeros(0, dtype=dtype)
+
+    return columns, footer
+
+
+EXPORT_FORMATS = {
+        "tsv": write_tsv,
+        "csv": write_csv,
+        "graphml": write_graphml,
+        "json": write_node_link,
+        "columnar": write_columnar
+        }
+
+
+def export_edges(edges, target, format, node_attrs=None):
+    """Write 'edges' in one of EXPORT_FORMATS"""
+    if format not in EXPORT_FORMATS:
+        estr = "Unknown export format: {}".format(format)
+        raise SdblExportException(estr)
+
+    return EXPORT_FORMATS[format](edges, target, node_attrs=node_attrs)
@@ -2,23 +2,182 @@
 # Author: Henry Amrhein
 # Date: 19 OCT 2019
 
-import io
+import concurrent.futures
+import math
+import os.path
 
 import pygraphviz
-import imageio
 
+import analytics
 import edge_engine
+import instrument
 import sql
 
-import matplotlib.pyplot as plt
+
+# Gap in points between packed components
+PACK_GAP = 36.0
+
+# Cheaper sfdp settings for draft layouts: fewer iterations, the fast
+# quadtree, fewer multilevel steps, straight edges and overlap removal by
+# scaling
+DRAFT_LAYOUT_ATTR = {
+        "maxiter": "100",
+        "quadtree": "fast",
+        "levels": "2",
+        "splines": "false",
+        "overlap": "scale"
+        }
+
+# Small, low resolution preview of a draft layout
+DRAFT_RENDER_ATTR = {
+        "dpi": "36",
+        "size": "12,12"
+        }
+
+# Color of coarse edges that join more than one edge mode
+COARSE_EDGE_COLOR = "#808080a0"
+
+# Supernode width and height in inches per square root of its size
+SUPERNODE_SCALE = 0.5
 
 
 class SdblGraphException(Exception):
     pass
 
 
+def layout_component(job):
+    """Lay out one component given as DOT text.  Runs in a worker process
+    and returns the bounding box and the node positions."""
+    dot, prog = job
+    A = pygraphviz.AGraph(string=dot)
+    A.layout(prog=prog)
+    bb = [float(c) for c in A.graph_attr["bb"].split(",")]
+    pos = dict()
+
+    for n in A.nodes():
+        x, y = n.attr["pos"].rstrip("!").split(",")[:2]
+        pos[str(n)] = (float(x), float(y))
+
+    A.close()
+
+    return bb, pos
+
+
+def route_edges(A):
+    """Compute edge splines over fixed node positions, like neato -n2.
+    Graphviz run as a library knows this as the nop2 layout; pygraphviz
+    versions that run the layout programs need the neato flag instead."""
+    try:
+        A.layout(prog="nop2")
+    except ValueError:
+        A.layout(prog="neato", args="-n2")
+
+
+def pack_boxes(sizes, gap=PACK_GAP):
+    """Shelf pack (width, height) boxes in the given order, left to right
+    and then top to bottom.  Returns the lower left corner of each box with
+    the origin at the bottom left of the whole canvas."""
+    if len(sizes) == 0:
+        return list()
+
+    area = sum((w + gap) * (h + gap) for w, h in sizes)
+    row_width = max(max(w for w, h in sizes), math.sqrt(area))
+
+    x = 0.0
+    top = 0.0
+    row_height = 0.0
+    placed = list()
+
+    for w, h in sizes:
+        if x > 0 and x + w > row_width:
+            top += row_height + gap
+            x = 0.0
+            row_height = 0.0
+
+        placed.append((x, top, h))
+        x += w + gap
+        row_height = max(row_height, h)
+
+    height = top + row_height
+
+    return [(x, height - t - h) for x, t, h in placed]
+
+
+def place_nodes(fixed, new, neighbours, length=72.0, iterations=50):
+    """Positions for the 'new' nodes among 'fixed' ones, given as name to
+    (x, y).  Each new node starts at the mean of its placed neighbours, or
+    beside the drawing when it has none, and is then moved by springs to
+    its neighbours, at the edge length 'length', and away from nodes nearer
+    than that.  Fixed nodes do not move, so the cost grows with the number
+    of new nodes rather than the whole graph.
+
+    This stands in for a warm started sfdp run: sfdp ignores pinned
+    "x,y!" positions and moves every node, and fdp, which keeps them,
+    still iterates over the whole graph and takes longer than a fresh
+    sfdp layout."""
+    import numpy as np
+
+    names = list(fixed) + [n for n in new if n not in fixed]
+    index = {n: i for i, n in enumerate(names)}
+    xy = np.zeros((len(names), 2))
+    xy[:len(fixed)] = list(fixed.values())
+    start = len(fixed)
+    right = xy[:start, 0].max() + length if start > 0 else 0.0
+    centre = xy[:start, 1].mean() if start > 0 else 0.0
+    placed = set(fixed)
+
+    # place nodes next to placed neighbours first, so chains of new nodes
+    # grow outwards from the drawing
+    todo = names[start:]
+    while len(todo) > 0:
+        ready = [n for n in todo if neighbours[n] & placed]
+
+        if len(ready) == 0:
+            ready = todo[:1]
+
+        for n in ready:
+            i = index[n]
+            near = [index[m] for m in neighbours[n] if m in placed]
+            angle = i * 2.39996
+
+            if len(near) > 0:
+                xy[i] = xy[near].mean(axis=0)
+            else:
+                xy[i] = (right, centre)
+                right += length
+
+            xy[i] += 0.5 * length * np.array([math.cos(angle),
+                math.sin(angle)])
+
+        placed.update(ready)
+        todo = [n for n in todo if n not in placed]
+
+    pairs = [(index[n], index[m]) for n in names[start:]
+            for m in neighbours[n] if m in index]
+
+    for t in range(iterations):
+        step = 0.1 * length * (1 - t / iterations)
+        force = np.zeros((len(names) - start, 2))
+
+        for i, j in pairs:
+            d = xy[j] - xy[i]
+            r = max(math.hypot(*d), 1e-6)
+            force[i - start] += (r - length) / r * d
+
+        d = xy[start:, None, :] - xy[None, :, :]
+        r = np.maximum(np.hypot(d[..., 0], d[..., 1]), 1e-6)
+        push = np.where(r < length, (length - r) / r, 0.0)
+        push[np.arange(len(names) - start), np.arange(start, len(names))] = 0
+        force += (push[..., None] * d).sum(axis=1)
+
+        norm = np.maximum(np.hypot(force[:, 0], force[:, 1]), 1e-6)
+        xy[start:] += force * (np.minimum(norm, step) / norm)[:, None]
+
+    return {n: tuple(xy[index[n]]) for n in names[start:]}
+
+
 class SdblGraph:
-    def __init__(self, dbfile, name=None):
+    def __init__(self, dbfile, name=None, report=None, cache=None):
         self.gattr = {
                 "overlap": "false",
                 "splines": "false",
@@ -36,13 +195,52 @@ class SdblGraph:
                 }
 
         self.dbfile = dbfile
+        self.gobj_loader = None
         self.gobj = pygraphviz.AGraph(name=name, directed=True, strict=False)
         self.looping = list()
         self.disconnected = None
+        self.edge_data = dict()
+        self.connectivity = analytics.SdblConnectivity()
         self.color_dict = None
+        self.report = instrument.report_or_null(report)
+        self.cache = cache
+        self.draft = False
+        self.full_attr = dict()
+        self.build_params = None
+        self.rows = None
+        self.fine = None
+        self.supernodes = dict()
+        self.supernode_labels = dict()
+        self.community_of = dict()
+        self.collapsed = set()
 
     def __del__(self):
-        self.gobj.close()
+        if self._gobj is not None:
+            self._gobj.close()
+
+    @property
+    def gobj(self):
+        """The Graphviz AGraph.  A graph restored from a snapshot is built
+        the first time it is needed."""
+        if self.gobj_loader is not None:
+            loader, self.gobj_loader = self.gobj_loader, None
+            self._gobj = loader()
+
+        return self._gobj
+
+    @gobj.setter
+    def gobj(self, A):
+        self.gobj_loader = None
+        self._gobj = A
+
+    def defer_gobj(self, loader):
+        """Close the AGraph and have 'loader' build its replacement when it
+        is next needed"""
+        if self._gobj is not None:
+            self._gobj.close()
+
+        self._gobj = None
+        self.gobj_loader = loader
 
     def __str__(self):
         return str(self.gobj)
@@ -84,16 +282,43 @@ class SdblGraph:
     def build_graph(self, gene_list, cutoff, modes, schema="action",
             connected=True, looping=False, penwidth_multiplier=2, name="",
             graphattr=None, edgeattr=None, nodeattr=None, label=None,
-            labelpos='t', labelfont="sans serif bold", labelfontsize=48):
+            labelpos='t', labelfont="sans serif bold", labelfontsize=48,
+            radius=0, top_n=None, max_nodes=None, edges_per_node=None,
+            per_mode=False, edge_budget=None, density_budget=None,
+            min_cutoff=0):
         """Build the graph from a list of gene names, a cutoff score, and
-        a set of edge modes."""
+        a set of edge modes.  With radius > 0 the gene list is used as
+        seeds and the graph is the neighbourhood reached in that many hops,
+        keeping the top_n best scoring new partners per hop and at most
+        max_nodes genes; see SdblSql.neighborhood_query.  With
+        edges_per_node set, only the highest scoring edges at each node are
+        kept (per edge mode if per_mode); see SdblEdgeEngine.sparsify.
+
+        With cutoff=None the cutoff is chosen to fit edge_budget edges or
+        density_budget, but not below min_cutoff, and is recorded in the
+        sdbl_cutoff graph attribute; see SdblSql.budget_cutoff."""
 
         self.initialize_graph(name, label, labelpos, labelfont,
                 labelfontsize, graphattr, edgeattr, nodeattr)
 
-        dbh = sql.SdblSql(self.dbfile)
+        dbh = sql.SdblSql(self.dbfile, report=self.report, cache=self.cache)
+
+        if cutoff is None:
+            if radius > 0:
+                dbh.close()
+                estr = "Budgeted cutoffs need radius=0"
+                raise SdblGraphException(estr)
 
-        if schema == "action":
+            cutoff = dbh.budget_cutoff(gene_list, edge_budget=edge_budget,
+                    density_budget=density_budget, schema=schema,
+                    modes=modes, min_cutoff=min_cutoff)
+            self.gobj.graph_attr["sdbl_cutoff"] = cutoff
+
+        if radius > 0:
+            res = dbh.neighborhood_query(gene_list, radius, cutoff,
+                    schema=schema, modes=modes, top_n=top_n,
+                    max_nodes=max_nodes)
+        elif schema == "action":
             res = dbh.actions_query_multiple_genes(gene_list,
                     cutoff_score=cutoff)
         else:
@@ -102,29 +327,256 @@ class SdblGraph:
 
         dbh.close()
 
-        ee = edge_engine.SdblEdgeEngine(res)
+        self.rows = res
+        self.build_params = {"cutoff": cutoff, "modes": modes,
+                "schema": schema, "looping": looping,
+                "penwidth_multiplier": penwidth_multiplier, "radius": radius,
+                "edges_per_node": edges_per_node, "per_mode": per_mode}
+
+        ee = edge_engine.SdblEdgeEngine(res, report=self.report)
         ee.generate_edges()
 
-        for k, v in ee:
-            if k[0] == k[1]:
-                self.looping.append(k)
-                if looping == False:
+        if edges_per_node is not None:
+            ee.sparsify(edges_per_node, per_mode=per_mode, modes=modes)
+
+        self.connectivity.set_inputs(gene_list)
+
+        with self.report.stage("build_graph"):
+            for k, v in ee:
+                if k[0] == k[1]:
+                    self.looping.append(k)
+                    if looping == False:
+                        continue
+
+                if k[2] not in modes:
                     continue
 
-            if k[2] not in modes:
-                continue
+                self.add_sdbl_edge(k, v, penwidth_multiplier)
+                self.edge_data[k] = v
+                self.connectivity.add_edge(k[0], k[1])
+
+        self.disconnected = self.connectivity.isolated()
+
+        self.report.set("nodes", len(self.gobj))
+        self.report.set("edges", self.gobj.number_of_edges())
+        self.report.set("disconnected", len(self.disconnected))
+
+    def add_sdbl_edge(self, k, v, penwidth_multiplier=2):
+        self.gobj.add_edge(k[0], k[1], weight=v.score, key=k,
+                dir=v.direction, style="solid", arrowhead=v.arrowtype,
+                arrowtail=v.arrowtype, color=self.color_dict[k[2]],
+                penwidth=v.penwidth * penwidth_multiplier)
+
+    def update(self, add=(), remove=(), relayout=True):
+        """Add genes to and remove genes from a built graph.  Only the
+        edges of the added genes are queried; the edges of removed genes
+        are dropped from the rows kept from the last query, and the edge
+        engine runs again over those rows, so scores, penwidths and the
+        disconnected genes come out as a fresh build would give them.
+        Nodes left without edges are removed.
+
+        With relayout and an existing layout, the nodes that were there
+        keep their positions and the new ones are placed among their
+        neighbours by place_nodes; call layout() for a fresh layout, and
+        add_disconnected_right() again if it was used."""
+        p = self.build_params
+
+        if p is None:
+            estr = "Build the graph before updating it"
+            raise SdblGraphException(estr)
+
+        if p["radius"] > 0 or self.fine is not None:
+            estr = "Neighbourhood and coarsened graphs can't be updated"
+            raise SdblGraphException(estr)
+
+        remove = set(remove)
+        old = self.connectivity.inputs
+        inputs = [g for g in old if g not in remove]
+        add = [g for g in dict.fromkeys(add) if g not in inputs]
 
-            self.gobj.add_edge(k[0], k[1], weight=v.score, key=k,
-                    dir=v.direction, style="solid", arrowhead=v.arrowtype,
-                    arrowtail=v.arrowtype, color=self.color_dict[k[2]],
-                    penwidth=v.penwidth * penwidth_multiplier)
+        dbh = sql.SdblSql(self.dbfile, report=self.report, cache=self.cache)
+        old_aliases = dbh.get_aliases(old)
+        aliases = dbh.get_aliases(inputs + add)
 
-            self.disconnected = [g for g in gene_list if g not in self.gobj]
+        # a protein found by several of the names can change hands when
+        # names come and go; the edges of both names are read again
+        stale = set(add)
 
-    def layout(self, prog="sfdp"):
-        """Arrange the nodes using a specified layout program"""
+        for prot in set(old_aliases) | set(aliases):
+            a = old_aliases.get(prot)
+            b = aliases.get(prot)
 
-        self.gobj.layout(prog=prog)
+            if a != b:
+                stale.update(n for n in (a, b) if n is not None)
+
+        # a gene both removed and added is read again like any added gene
+        stale -= remove - set(add)
+        drop = stale | remove
+        rows = [r for r in self.rows if r[0] not in drop and
+                r[1] not in drop]
+
+        if len(stale) > 0:
+            rows = sorted(rows + dbh.partner_query(sorted(stale),
+                [g for g in inputs + add if g not in stale], p["cutoff"],
+                schema=p["schema"], aliases=aliases))
+
+        dbh.close()
+
+        with self.report.stage("update"):
+            edges = dict()
+            self.looping = list()
+
+            if len(rows) > 0:
+                ee = edge_engine.SdblEdgeEngine(rows, report=self.report)
+                ee.generate_edges()
+
+                if p["edges_per_node"] is not None:
+                    ee.sparsify(p["edges_per_node"], per_mode=p["per_mode"],
+                            modes=p["modes"])
+
+                for k, v in ee:
+                    if k[0] == k[1]:
+                        self.looping.append(k)
+                        if p["looping"] == False:
+                            continue
+
+                    if k[2] in p["modes"]:
+                        edges[k] = v
+
+            self.apply_edges(edges, p["penwidth_multiplier"])
+
+            self.rows = rows
+            self.connectivity = analytics.SdblConnectivity(
+                    ((k[0], k[1]) for k in edges), inputs=inputs + add)
+            self.disconnected = self.connectivity.isolated()
+
+        if relayout and self.gobj.has_layout:
+            with self.report.stage("layout"):
+                self.place_new_nodes()
+
+        self.report.set("nodes", len(self.gobj))
+        self.report.set("edges", self.gobj.number_of_edges())
+        self.report.set("disconnected", len(self.disconnected))
+
+    def apply_edges(self, edges, penwidth_multiplier):
+        """Make the graph's edges those of 'edges', keeping the nodes and
+        edges that stay along with their attributes"""
+        A = self.gobj
+        removed = [k for k in self.edge_data if k not in edges]
+        added = [k for k in edges if k not in self.edge_data]
+
+        for k in removed:
+            A.delete_edge(k[0], k[1], key=str(k))
+
+        for k in added:
+            self.add_sdbl_edge(k, edges[k], penwidth_multiplier)
+
+        # penwidths are scaled to the score range of all the rows
+        for k, v in edges.items():
+            if k in self.edge_data:
+                e = A.get_edge(k[0], k[1], key=str(k))
+                e.attr["weight"] = v.score
+                e.attr["penwidth"] = v.penwidth * penwidth_multiplier
+
+        ends = {n for k in edges for n in k[:2]}
+
+        for n in A.nodes():
+            if n not in ends:
+                A.delete_node(n)
+
+        self.edge_data = edges
+
+        self.report.count("edges_added", len(added))
+        self.report.count("edges_removed", len(removed))
+
+    def place_new_nodes(self, iterations=50):
+        """Position nodes that have no position among those that do, which
+        stay where they are, then route the edges"""
+        A = self.gobj
+        fixed = dict()
+        new = list()
+
+        for n in A.nodes():
+            pos = n.attr.get("pos")
+
+            if pos:
+                x, y = pos.rstrip("!").split(",")[:2]
+                fixed[str(n)] = (float(x), float(y))
+            else:
+                new.append(str(n))
+
+        if len(new) > 0:
+            neighbours = {n: set() for n in new}
+            lengths = sorted(math.hypot(fixed[k[0]][0] - fixed[k[1]][0],
+                    fixed[k[0]][1] - fixed[k[1]][1])
+                    for k in self.edge_data if k[0] != k[1] and
+                    k[0] in fixed and k[1] in fixed)
+
+            for k in self.edge_data:
+                if k[0] in neighbours:
+                    neighbours[k[0]].add(k[1])
+
+                if k[1] in neighbours:
+                    neighbours[k[1]].add(k[0])
+
+            # new nodes sit at the typical edge length of the old layout
+            length = lengths[len(lengths) // 2] if lengths else 72.0
+
+            for n, (x, y) in place_nodes(fixed, new, neighbours, length,
+                    iterations).items():
+                A.get_node(n).attr["pos"] = "{},{}".format(x, y)
+
+        self.route_pinned()
+
+    def set_draft(self, draft):
+        """Switch the graph attributes between DRAFT_LAYOUT_ATTR and the
+        values they had before the first draft.  Leaving draft mode drops
+        the draft positions so the next layout starts afresh."""
+        A = self.gobj
+
+        if draft and not self.draft:
+            self.full_attr = {k: A.graph_attr.get(k) for k in
+                    DRAFT_LAYOUT_ATTR}
+            A.graph_attr.update(DRAFT_LAYOUT_ATTR)
+        elif self.draft and not draft:
+            for k, v in self.full_attr.items():
+                if v is None:
+                    del A.graph_attr[k]
+                else:
+                    A.graph_attr[k] = v
+
+            for n in A.nodes():
+                if n.attr.get("pos"):
+                    del n.attr["pos"]
+
+            for e in A.edges():
+                if e.attr.get("pos"):
+                    del e.attr["pos"]
+
+            if A.graph_attr.get("bb"):
+                del A.graph_attr["bb"]
+
+            A.has_layout = False
+            self.full_attr = dict()
+
+        self.draft = draft
+
+    def layout(self, prog="sfdp", components=False, processes=None,
+            draft=False):
+        """Arrange the nodes using a specified layout program.  With
+        components=True each connected component is laid out in its own
+        worker process and the results are packed onto one canvas.
+
+        With draft=True the layout uses the cheaper DRAFT_LAYOUT_ATTR
+        settings and draw() makes a small preview.  Calling layout again
+        without draft lays the same graph out at full quality."""
+        self.set_draft(draft)
+
+        with self.report.stage("layout"):
+            if components:
+                self.layout_components(prog, processes)
+            else:
+                self.gobj.layout(prog=prog)
 
         A = pygraphviz.AGraph(str(self.gobj))
 
@@ -132,15 +584,315 @@ class SdblGraph:
         self.eattr = dict(A.edge_attr)
         self.nattr = dict(A.node_attr)
 
-    def draw(self, filename, format=None):
-        """write a graphic file of the current graph.
-        Use 'dot -T:' to list the available output formats"""
+    def component_dots(self):
+        """DOT text for each connected component, largest first"""
+        conn = self.connectivity
+
+        if len(conn) == 0 or self.fine is not None:
+            conn = analytics.SdblConnectivity(self.gobj.edges())
+
+            # supernodes can have no edges
+            for n in self.gobj.nodes():
+                conn.add_node(n)
+
+        comps = conn.components()
+        index = {conn.find(c[0]): i for i, c in enumerate(comps)}
+        graphs = list()
+
+        for c in comps:
+            A = pygraphviz.AGraph(directed=self.gobj.directed, strict=False)
+            A.graph_attr.update(self.gobj.graph_attr)
+            A.node_attr.update(self.gobj.node_attr)
+            A.edge_attr.update(self.gobj.edge_attr)
+            graphs.append(A)
 
-        self.gobj.draw(filename, format=format)
+        for n in self.gobj.nodes():
+            if n in conn:
+                graphs[index[conn.find(n)]].add_node(n, **n.attr)
+
+        for e in self.gobj.edges():
+            attr = dict(e.attr)
+            attr.pop("key", None)
+            graphs[index[conn.find(e[0])]].add_edge(e[0], e[1], key=e.name,
+                    **attr)
+
+        dots = [str(A) for A in graphs]
+
+        for A in graphs:
+            A.close()
+
+        return dots
+
+    def layout_components(self, prog="sfdp", processes=None):
+        """Lay out each connected component separately, in parallel, then
+        pack them deterministically and route edges over the packed
+        positions"""
+        jobs = [(dot, prog) for dot in self.component_dots()]
+
+        if processes == 1 or len(jobs) < 2:
+            results = [layout_component(j) for j in jobs]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+                results = list(pool.map(layout_component, jobs))
+
+        sizes = [(bb[2] - bb[0], bb[3] - bb[1]) for bb, pos in results]
+
+        for (bb, pos), (ox, oy) in zip(results, pack_boxes(sizes)):
+            for n, (x, y) in pos.items():
+                self.gobj.get_node(n).attr["pos"] = "{},{}!".format(
+                        x - bb[0] + ox, y - bb[1] + oy)
+
+        self.report.set("components", len(jobs))
+
+        # components are already overlap free and packed apart
+        self.route_pinned()
+
+    def route_pinned(self):
+        """Route edges over the current node positions, keeping neato from
+        moving the nodes to remove overlaps"""
+        overlap = self.gobj.graph_attr.get("overlap")
+        self.gobj.graph_attr["overlap"] = "true"
+        route_edges(self.gobj)
+        self.gobj.graph_attr["overlap"] = overlap or ""
+
+    def coarsen(self, min_size=3, max_iter=20):
+        """Collapse communities of at least min_size genes, found by label
+        propagation over the edge scores, into supernodes.  The full graph
+        is kept as self.fine and the coarse view becomes the graph that is
+        laid out and drawn.  Coarse edges join the supernodes and genes
+        that any edge joined, with the summed scores as their weight.
+        Color the nodes first; the view copies the fine node attributes."""
+        if self.fine is not None:
+            estr = "Graph is already coarsened"
+            raise SdblGraphException(estr)
+
+        edges = [(k[0], k[1], v.score) for k, v in self.edge_data.items()]
+        groups = analytics.communities(analytics.label_propagation(edges,
+            max_iter))
+        weight = dict()
+
+        for u, v, w in edges:
+            if u != v:
+                weight[u] = weight.get(u, 0) + w
+                weight[v] = weight.get(v, 0) + w
+
+        for members in groups:
+            if len(members) < min_size:
+                break
+
+            name = "community_{}".format(len(self.supernodes) + 1)
+            hub = max(members, key=lambda m: (weight[m], m))
+            self.supernodes[name] = members
+            self.supernode_labels[name] = "{}\n+{}".format(hub,
+                    len(members) - 1)
+
+            for m in members:
+                self.community_of[m] = name
+
+        self.collapsed = set(self.supernodes)
+        self.fine = self.gobj
+        self.gobj = self.coarse_view(dict())
+
+        self.report.set("communities", len(self.supernodes))
+        self.report.set("coarse_nodes", len(self.gobj))
+        self.report.set("coarse_edges", self.gobj.number_of_edges())
+
+    def view_of(self, node):
+        """Supernode that stands for 'node', or the node itself"""
+        c = self.community_of.get(node)
+
+        return c if c in self.collapsed else node
+
+    def coarse_view(self, positions):
+        """AGraph of the fine graph with the collapsed communities as
+        supernodes.  Nodes in 'positions' are pinned there."""
+        F = self.fine
+        A = pygraphviz.AGraph(name=F.name, directed=F.directed, strict=False)
+        A.graph_attr.update(F.graph_attr)
+        A.node_attr.update(F.node_attr)
+        A.edge_attr.update(F.edge_attr)
+
+        for n in F.nodes():
+            v = self.view_of(n)
+
+            if v in A:
+                continue
+
+            if v == n:
+                attr = dict(n.attr)
+            else:
+                size = SUPERNODE_SCALE * math.sqrt(len(self.supernodes[v]))
+                attr = {"label": self.supernode_labels[v],
+                        "width": size,
+                        "height": size,
+                        "sdbl_members": len(self.supernodes[v])}
+
+            attr.pop("pos", None)
+
+            if v in positions:
+                attr["pos"] = "{},{}!".format(*positions[v])
+
+            A.add_node(v, **attr)
+
+        coarse = dict()
+
+        for e in F.edges():
+            a = self.view_of(e[0])
+            b = self.view_of(e[1])
+
+            if a == e[0] and b == e[1]:
+                attr = dict(e.attr)
+                attr.pop("key", None)
+                attr.pop("pos", None)
+                A.add_edge(e[0], e[1], key=e.name, **attr)
+            elif a != b:
+                c = coarse.setdefault(tuple(sorted((a, b))),
+                        [0.0, 0, set()])
+                c[0] += float(e.attr.get("weight") or 1)
+                c[1] += 1
+                c[2].add(e.attr.get("color"))
+
+        for (a, b), (w, n, colors) in coarse.items():
+            color = colors.pop() if len(colors) == 1 else COARSE_EDGE_COLOR
+            A.add_edge(a, b, key="{}|{}".format(a, b), weight=w,
+                    penwidth=1 + math.log2(n), color=color, dir="none",
+                    arrowhead="none", arrowtail="none", style="solid")
+
+        return A
+
+    def expand(self, supernode, prog="sfdp"):
+        """Replace a supernode, or the supernode holding a gene, with its
+        genes.  The genes are laid out on their own around the
+        supernode's position; every other node stays where it is."""
+        if self.fine is None:
+            estr = "Graph is not coarsened"
+            raise SdblGraphException(estr)
+
+        name = supernode if supernode in self.supernodes else \
+                self.community_of.get(supernode)
+
+        if name not in self.collapsed:
+            estr = "No collapsed supernode for {}".format(supernode)
+            raise SdblGraphException(estr)
+
+        if not self.gobj.has_layout:
+            estr = "Lay out the coarse graph before expanding it"
+            raise SdblGraphException(estr)
+
+        positions = dict()
+
+        for n in self.gobj.nodes():
+            x, y = n.attr["pos"].rstrip("!").split(",")[:2]
+            positions[str(n)] = (float(x), float(y))
+
+        cx, cy = positions.pop(name)
+        members = set(self.supernodes[name])
+
+        with self.report.stage("expand"):
+            F = self.fine
+            A = pygraphviz.AGraph(directed=F.directed, strict=False)
+            A.graph_attr.update(F.graph_attr)
+            A.node_attr.update(F.node_attr)
+            A.edge_attr.update(F.edge_attr)
+
+            for n in sorted(members):
+                attr = dict(F.get_node(n).attr)
+                attr.pop("pos", None)
+                A.add_node(n, **attr)
+
+            for e in F.edges():
+                if e[0] in members and e[1] in members:
+                    A.add_edge(e[0], e[1], key=e.name)
+
+            bb, pos = layout_component((A.string(), prog))
+            A.close()
+
+            ox = cx - (bb[0] + bb[2]) / 2
+            oy = cy - (bb[1] + bb[3]) / 2
+
+            for n, (x, y) in pos.items():
+                positions[n] = (x + ox, y + oy)
+
+            self.collapsed.discard(name)
+            self.gobj.close()
+            self.gobj = self.coarse_view(positions)
+            self.route_pinned()
+
+    def draw(self, filename, format=None, draft=None):
+        """write a graphic file of the current graph.
+        Use 'dot -T:' to list the available output formats.  A draft
+        layout is drawn as a small preview unless draft=False."""
+        if draft is None:
+            draft = self.draft
+
+        if not draft:
+            self._draw(filename, format)
+            return
+
+        A = self.gobj
+        saved = {k: A.graph_attr.get(k) for k in DRAFT_RENDER_ATTR}
+        A.graph_attr.update(DRAFT_RENDER_ATTR)
+
+        try:
+            self._draw(filename, format)
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    del A.graph_attr[k]
+                else:
+                    A.graph_attr[k] = v
+
+    def _draw(self, filename, format):
+        if not self.report.enabled:
+            self.gobj.draw(filename, format=format)
+            return
+
+        with self.report.stage("render"):
+            if isinstance(filename, str):
+                self.gobj.draw(filename, format=format)
+                nbytes = os.path.getsize(filename)
+            elif hasattr(filename, "tell"):
+                start = filename.tell()
+                self.gobj.draw(filename, format=format)
+                nbytes = filename.tell() - start
+            else:
+                self.gobj.draw(filename, format=format)
+                nbytes = 0
+
+        self.report.count("bytes_rendered", nbytes)
 
     def write(self, filename):
         """write a DOT file of the current graph"""
-        self.gobj.write(filename)
+        with self.report.stage("write"):
+            self.gobj.write(filename)
+
+    def node_attributes(self, names=("fillcolor", "fontcolor")):
+        """Dictionary of node name to the named attributes that are set,
+        including disconnected genes that have no node"""
+        result = dict()
+
+        for n in self.gobj.nodes():
+            attrs = {k: n.attr[k] for k in names if n.attr.get(k)}
+            result[str(n)] = attrs
+
+        for g in self.disconnected or ():
+            result.setdefault(g, dict())
+
+        return result
+
+    def export(self, filename, format, node_attrs=None):
+        """Write the edges in one of export.EXPORT_FORMATS, straight from
+        the edge data rather than through Graphviz"""
+        import export
+
+        if node_attrs is None:
+            node_attrs = self.node_attributes()
+
+        with self.report.stage("export"):
+            n = export.export_edges(self.edge_data.items(), filename, format,
+                    node_attrs=node_attrs)
+
+        self.report.count("edges_exported", n)
 
     def set_node_fill_color(self, node, color):
         if node not in self.gobj:
@@ -156,4 +908,22 @@ class SdblGraph:
 
     def load(self, dotfile):
         self.gobj = pygraphviz.AGraph(filename=dotfile)
+
+    def save_snapshot(self, filename):
+        """write a binary snapshot of the graph, its layout and the edge
+        data, which load_snapshot restores without re-laying out"""
+        import snapshot
+
+        if self.fine is not None:
+            estr = "Coarsened graphs can't be saved as snapshots"
+            raise SdblGraphException(estr)
+
+        with self.report.stage("save_snapshot"):
+            snapshot.save_snapshot(self, filename)
+
+    def load_snapshot(self, filename):
+        import snapshot
+
+        with self.report.stage("load_snapshot"):
+            snapshot.load_snapshot(filename, self)
         
@@ -0,0 +1,251 @@
+# HDF5 data access for SDBL figure scripts
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import contextlib
+import os
+import os.path
+
+import numpy as np
+import pandas as pd
+
+"""Single-open access to the 10x HDF5 data file with a columnar cache"""
+
+__version__ = 1.0
+
+METADATA_KEY = "/metadata"
+
+COUNTS_KEY = "/counts_by_cluster_normalized"
+
+MARKER_PREFIX = "/marker_genes/"
+
+CACHE_SUFFIX = ".sdblcache.npz"
+
+
+class SdblH5StoreException(Exception):
+    pass
+
+
+def source_stamp(filename):
+    st = os.stat(filename)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+
+def str_array(values):
+    """Fixed width unicode array, so the cache loads without pickling"""
+    return np.array([str(v) for v in values], dtype=str)
+
+
+class SdblH5Store:
+    """Metadata, marker gene lists and count columns from the HDF5 file.
+
+    The HDF5 file is opened once and every marker gene list is read in
+    that pass.  Count columns are read when first asked for.  Unless
+    cache=False, a columnar copy is written next to the input as
+    <datafile>.sdblcache.npz, or into 'cache_dir' if given, and used by
+    later runs while the input's size and modification time are unchanged.
+    If the cache can't be written, as beside a data file in a read-only
+    image, the store carries on without it.  Labels from the cache are
+    strings."""
+
+    def __init__(self, datafile, cache=True, cache_dir=None):
+        self.datafile = datafile
+
+        if cache_dir is None:
+            self.cache_file = datafile + CACHE_SUFFIX
+        else:
+            self.cache_file = os.path.join(cache_dir,
+                    os.path.basename(datafile) + CACHE_SUFFIX)
+
+        self.store = None
+        self.npz = None
+        self.count_columns = dict()
+        self.count_frame = None
+        self.cached_matrix = None
+
+        if cache and self._cache_is_current():
+            self._load_cache()
+            return
+
+        self._load_hdf()
+
+        if cache:
+            try:
+                self.write_cache()
+            except OSError:
+                pass
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+        if self.npz is not None:
+            self.npz.close()
+            self.npz = None
+
+    def _cache_is_current(self):
+        if not os.path.exists(self.cache_file):
+            return False
+
+        try:
+            with np.load(self.cache_file, allow_pickle=False) as z:
+                return np.array_equal(z["stamp"],
+                        source_stamp(self.datafile))
+        except (OSError, KeyError, ValueError):
+            return False
+
+    def _load_hdf(self):
+        self.store = pd.HDFStore(self.datafile, mode="r")
+        self.metadata = self.store[METADATA_KEY]
+
+        self.markers = dict()
+
+        for key in self.store.keys():
+            if key.startswith(MARKER_PREFIX):
+                name = key[len(MARKER_PREFIX):]
+                self.markers[name] = self.store[key].tolist()
+
+        storer = self.store.get_storer(COUNTS_KEY)
+
+        if storer.is_table:
+            self.labels = list(storer.non_index_axes[0][1])
+        else:
+            self.count_frame = self.store[COUNTS_KEY]
+            self.labels = list(self.count_frame.columns)
+
+    def _load_cache(self):
+        self.npz = np.load(self.cache_file, allow_pickle=False)
+        z = self.npz
+
+        self.metadata = pd.DataFrame({"unified_label": z["meta_label"],
+            "color": z["meta_color"], "gene_series": z["meta_series"]})
+
+        genes = z["marker_genes"].tolist()
+        offsets = z["marker_offsets"]
+        self.markers = {n: genes[offsets[i]:offsets[i + 1]]
+                for i, n in enumerate(z["marker_names"].tolist())}
+
+        self.labels = z["count_labels"].tolist()
+        self.count_index = pd.Index(z["count_genes"])
+
+    def colors(self):
+        return dict(zip(self.metadata["unified_label"],
+            self.metadata["color"]))
+
+    def gene_series(self):
+        return dict(zip(self.metadata["unified_label"],
+            self.metadata["gene_series"]))
+
+    def marker_genes(self, name):
+        """Marker gene list, or an empty list for an unknown series"""
+        return list(self.markers.get(name, ()))
+
+    def counts(self, label):
+        """Count column for one cluster, read on first use"""
+        if label in self.count_columns:
+            return self.count_columns[label]
+
+        if label not in self.labels:
+            estr = "No count column for {}".format(label)
+            raise SdblH5StoreException(estr)
+
+        if self.npz is not None:
+            i = self.labels.index(label)
+            col = pd.Series(self._cached_matrix()[:, i],
+                    index=self.count_index, name=label)
+        elif self.count_frame is not None:
+            col = self.count_frame[label]
+        else:
+            col = self.store.select(COUNTS_KEY, columns=[label])[label]
+
+        self.count_columns[label] = col
+
+        return col
+
+    def _cached_matrix(self):
+        if self.cached_matrix is None:
+            self.cached_matrix = self.npz["count_matrix"]
+
+        return self.cached_matrix
+
+    def count_matrix(self, labels=None):
+        if labels is None:
+            labels = self.labels
+
+        if self.npz is not None:
+            idx = [self.labels.index(l) for l in labels]
+            return pd.DataFrame(self._cached_matrix()[:, idx],
+                    index=self.count_index, columns=labels)
+
+        if self.count_frame is not None:
+            return self.count_frame[labels]
+
+        return self.store.select(COUNTS_KEY, columns=list(labels))
+
+    def quantile_bins(self, n_bins=16, labels=None):
+        """Quantiles of each cluster's counts over its own marker genes,
+        for every cluster at once.  Returns a frame of n_bins rows by
+        cluster, matching counts.reindex(markers)[label].dropna().quantile()
+        column by column.  Only the count columns of 'labels' are read."""
+        if labels is None:
+            labels = self.labels
+
+        gmap = self.gene_series()
+        gene_lists = {l: self.marker_genes(gmap[l]) for l in labels
+                if l in gmap}
+        labels = [l for l in labels if len(gene_lists.get(l, ())) > 0]
+        qspace = np.linspace(0, 1, n_bins)
+
+        # a gene listed twice would be weighted twice by the per-cluster
+        # reindex, which a membership mask can't express
+        repeated = [l for l in labels
+                if len(set(gene_lists[l])) != len(gene_lists[l])]
+        masked = [l for l in labels if l not in repeated]
+
+        frame = self.count_matrix(labels)
+        union = list(dict.fromkeys(g for l in masked for g in gene_lists[l]))
+        sub = frame[masked].reindex(union)
+        member = np.zeros(sub.shape, dtype=bool)
+        pos = {g: i for i, g in enumerate(union)}
+
+        for j, l in enumerate(masked):
+            member[[pos[g] for g in gene_lists[l]], j] = True
+
+        bins = sub.where(member).quantile(qspace)
+
+        for l in repeated:
+            bins[l] = frame[l].reindex(gene_lists[l]).dropna().quantile(
+                    qspace).values
+
+        return bins[labels]
+
+    def write_cache(self):
+        """Write the columnar copy of the data file"""
+        frame = self.count_matrix()
+        names = list(self.markers)
+        genes = [g for n in names for g in self.markers[n]]
+        offsets = np.cumsum([0] + [len(self.markers[n]) for n in names])
+        meta = self.metadata
+        tmpfile = self.cache_file + ".tmp.npz"
+
+        try:
+            np.savez(tmpfile, stamp=source_stamp(self.datafile),
+                    meta_label=str_array(meta["unified_label"]),
+                    meta_color=str_array(meta["color"]),
+                    meta_series=str_array(meta["gene_series"]),
+                    marker_names=str_array(names),
+                    marker_genes=str_array(genes),
+                    marker_offsets=offsets,
+                    count_labels=str_array(frame.columns),
+                    count_genes=str_array(frame.index),
+                    count_matrix=frame.values.astype(np.float64))
+
+            os.replace(tmpfile, self.cache_file)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmpfile)
+            raise
@@ -0,0 +1,118 @@
+# Instrumentation for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import json
+import threading
+import time
+
+"""Per-stage timings and counters reported by the SDBL pipeline"""
+
+__version__ = 1.0
+
+
+class SdblStageTimer:
+    __slots__ = ["report", "name", "start"]
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.report.add_time(self.name, time.perf_counter() - self.start)
+
+
+class SdblNullStage:
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        pass
+
+
+NULL_STAGE = SdblNullStage()
+
+
+class SdblNullReport:
+    """Report that records nothing.  Used when instrumentation is off."""
+
+    enabled = False
+
+    def stage(self, name):
+        return NULL_STAGE
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+
+NULL_REPORT = SdblNullReport()
+
+
+class SdblReport:
+    """Timings and counters for a single graph build.  Safe to update
+    from several threads."""
+
+    enabled = True
+
+    def __init__(self, name=None):
+        self.name = name
+        self.timings = dict()
+        self.counters = dict()
+        self.calls = dict()
+        self.lock = threading.Lock()
+
+    def __str__(self):
+        lines = ["SDBL report: {}".format(self.name)]
+
+        for k, v in self.timings.items():
+            lines.append("  {:20s} {:10.4f}s  ({} calls)".format(k, v,
+                self.calls[k]))
+
+        for k, v in self.counters.items():
+            lines.append("  {:20s} {:>10}".format(k, v))
+
+        return "\n".join(lines)
+
+    def stage(self, name):
+        """Context manager that adds its elapsed time to 'name'"""
+        return SdblStageTimer(self, name)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def as_dict(self):
+        return {"name": self.name, "timings": dict(self.timings),
+                "calls": dict(self.calls), "counters": dict(self.counters)}
+
+    def write_jsonl(self, filename):
+        """Append this report as one JSON line"""
+        with open(filename, "a") as ofs:
+            ofs.write(json.dumps(self.as_dict(), sort_keys=True))
+            ofs.write("\n")
+
+
+def report_or_null(report):
+    return NULL_REPORT if report is None else report
@@ -0,0 +1,238 @@
+# Incremental build pipeline for SDBL figures
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import os.path
+
+"""Dependency-tracked, incremental regeneration of SDBL figure outputs"""
+
+__version__ = 1.0
+
+MANIFEST_VERSION = 1
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class SdblPipelineException(Exception):
+    pass
+
+
+class SdblTarget:
+    """A set of output files made by one call of 'action'.
+
+    The target is stale when an output is missing or when the content of
+    its inputs, its parameters or its code files differ from the last
+    successful build.  'action' and 'args' must be picklable, since
+    targets run in worker processes."""
+
+    def __init__(self, name, outputs, action, args=(), kwargs=None, inputs=(),
+            params=None, code=()):
+        self.name = name
+        self.outputs = list(outputs)
+        self.action = action
+        self.args = tuple(args)
+        self.kwargs = kwargs if kwargs is not None else dict()
+        self.inputs = list(inputs)
+        self.params = params if params is not None else dict()
+        self.code = list(code)
+
+    def __repr__(self):
+        return "SdblTarget({!r})".format(self.name)
+
+
+def file_digest(filename, blocksize=1 << 20):
+    h = hashlib.sha256()
+
+    with open(filename, "rb") as ifs:
+        for block in iter(lambda: ifs.read(blocksize), b""):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def code_path(name):
+    """Resolve a code file relative to this directory or util/"""
+    for d in (MODULE_DIR, os.path.join(MODULE_DIR, "util")):
+        p = os.path.join(d, name)
+
+        if os.path.exists(p):
+            return p
+
+    return name
+
+
+def run_target(action, args, kwargs):
+    action(*args, **kwargs)
+
+
+class SdblPipeline:
+    def __init__(self, manifest_file, processes=None, verbose=False):
+        self.manifest_file = manifest_file
+        self.processes = processes
+        self.verbose = verbose
+        self.targets = dict()
+        self.producers = dict()
+        self.manifest = {"version": MANIFEST_VERSION, "targets": dict(),
+                "files": dict()}
+
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as ifs:
+                manifest = json.load(ifs)
+
+            if manifest.get("version") == MANIFEST_VERSION:
+                self.manifest = manifest
+
+    def add(self, target):
+        if target.name in self.targets:
+            estr = "Duplicate target: {}".format(target.name)
+            raise SdblPipelineException(estr)
+
+        for o in target.outputs:
+            if o in self.producers:
+                estr = "{} is produced by {} and {}".format(o,
+                        self.producers[o], target.name)
+                raise SdblPipelineException(estr)
+
+            self.producers[o] = target.name
+
+        self.targets[target.name] = target
+
+        return target
+
+    def dependencies(self, target):
+        return sorted({self.producers[i] for i in target.inputs
+                       if i in self.producers})
+
+    def content_hash(self, filename):
+        """sha256 of a file, reused while its size and mtime are unchanged"""
+        st = os.stat(filename)
+        stamp = [st.st_size, st.st_mtime_ns]
+        known = self.manifest["files"].get(filename)
+
+        if known is not None and known[:2] == stamp:
+            return known[2]
+
+        digest = file_digest(filename)
+        self.manifest["files"][filename] = stamp + [digest]
+
+        return digest
+
+    def signature(self, target):
+        h = hashlib.sha256()
+
+        for i in sorted(target.inputs):
+            h.update(i.encode("utf-8"))
+            h.update(self.content_hash(i).encode("utf-8"))
+
+        for c in sorted(target.code):
+            h.update(c.encode("utf-8"))
+            h.update(self.content_hash(code_path(c)).encode("utf-8"))
+
+        h.update(json.dumps(target.params, sort_keys=True,
+            default=str).encode("utf-8"))
+
+        return h.hexdigest()
+
+    def is_stale(self, target):
+        if not all(os.path.exists(o) for o in target.outputs):
+            return True
+
+        for i in target.inputs:
+            if not os.path.exists(i):
+                return True
+
+        last = self.manifest["targets"].get(target.name)
+
+        return last is None or last != self.signature(target)
+
+    def order(self):
+        """Targets in dependency order"""
+        done = list()
+        seen = set()
+
+        def visit(name, path):
+            if name in seen:
+                return
+
+            if name in path:
+                estr = "Dependency cycle through {}".format(name)
+                raise SdblPipelineException(estr)
+
+            for d in self.dependencies(self.targets[name]):
+                visit(d, path | {name})
+
+            seen.add(name)
+            done.append(self.targets[name])
+
+        for name in sorted(self.targets):
+            visit(name, frozenset())
+
+        return done
+
+    def stale(self):
+        """Names of the targets a run would rebuild.  Targets downstream of
+        a stale target are stale too, since their inputs will change."""
+        result = list()
+
+        for t in self.order():
+            if self.is_stale(t) or any(d in result for d in
+                    self.dependencies(t)):
+                result.append(t.name)
+
+        return result
+
+    def save(self):
+        tmpfile = self.manifest_file + ".tmp"
+
+        with open(tmpfile, "w") as ofs:
+            json.dump(self.manifest, ofs, indent=1, sort_keys=True)
+
+        os.replace(tmpfile, self.manifest_file)
+
+    def _log(self, msg):
+        if self.verbose:
+            print(msg, flush=True)
+
+    def run(self, force=False):
+        """Rebuild stale targets, running independent ones in parallel.
+        Returns the names of the targets that were built."""
+        todo = set(self.targets) if force else set(self.stale())
+        pending = {n: set(d for d in self.dependencies(self.targets[n])
+                          if d in todo) for n in todo}
+        built = list()
+        running = dict()
+
+        with concurrent.futures.ProcessPoolExecutor(self.processes) as pool:
+            while pending or running:
+                ready = sorted(n for n, deps in pending.items() if not deps)
+
+                for n in ready:
+                    t = self.targets[n]
+                    self._log("Building {}".format(n))
+                    running[pool.submit(run_target, t.action, t.args,
+                            t.kwargs)] = n
+                    del pending[n]
+
+                if not running:
+                    estr = "Unbuildable targets: {}".format(sorted(pending))
+                    raise SdblPipelineException(estr)
+
+                finished, _ = concurrent.futures.wait(running,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for f in finished:
+                    n = running.pop(f)
+                    f.result()
+
+                    self.manifest["targets"][n] = self.signature(self.targets[n])
+                    self.save()
+                    built.append(n)
+
+                    for deps in pending.values():
+                        deps.discard(n)
+
+        return built
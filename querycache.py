@@ -0,0 +1,152 @@
+# Query result cache for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import hashlib
+import json
+import os
+import os.path
+import pickle
+import tempfile
+import threading
+import zlib
+
+"""On-disk cache of SdblSql query results"""
+
+__version__ = 1.0
+
+CACHE_SUFFIX = ".sdblq"
+
+# Default limit on the total size of the cache directory
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class SdblQueryCache:
+    """Query results stored as compressed files in 'directory'.
+
+    Entries are keyed by the database fingerprint, the query name and its
+    parameters, so rebuilding the database (which gives it a new build id)
+    makes old entries unreachable; they age out when the directory grows
+    past max_bytes, least recently used first."""
+
+    def __init__(self, directory, max_bytes=CACHE_MAX_BYTES, level=6):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def __str__(self):
+        return "{} hits, {} misses, {} bytes".format(self.hits, self.misses,
+                self.size())
+
+    def key(self, fingerprint, name, params):
+        data = json.dumps([__version__, fingerprint, name, params],
+                sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key):
+        """Cached value, or None on a miss"""
+        filename = self.path(key)
+
+        try:
+            with open(filename, "rb") as ifs:
+                value = pickle.loads(zlib.decompress(ifs.read()))
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # the modification time orders entries for eviction
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+        with self.lock:
+            self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        """Store 'value' under 'key'.  A full or read-only cache directory
+        only loses the entry."""
+        data = zlib.compress(pickle.dumps(value,
+            protocol=pickle.HIGHEST_PROTOCOL), self.level)
+
+        try:
+            fd, tmpfile = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError:
+            return
+
+        try:
+            with os.fdopen(fd, "wb") as ofs:
+                ofs.write(data)
+
+            os.replace(tmpfile, self.path(key))
+        except OSError:
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
+
+            return
+
+        self.evict()
+
+    def entries(self):
+        """(mtime, size, filename) for every entry"""
+        result = list()
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return result
+
+        for name in names:
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+
+            filename = os.path.join(self.directory, name)
+
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+
+            result.append((st.st_mtime_ns, st.st_size, filename))
+
+        return result
+
+    def size(self):
+        return sum(e[1] for e in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits"""
+        entries = sorted(self.entries())
+        total = sum(e[1] for e in entries)
+
+        for mtime, size, filename in entries:
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+            total -= size
+
+    def clear(self):
+        for e in self.entries():
+            os.remove(e[2])
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "bytes": self.size()}
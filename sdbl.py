@@ -2,18 +2,13 @@
 # Author: Henry Amrhein
 # Date: 3 JAN 2020
 
-import os.path
-import matplotlib.patches
 import io
-import imageio
-
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
 
 import graph
 
+# numpy, pandas, matplotlib and imageio are imported inside the methods that
+# need them so that query and DOT-only callers do not pay for loading them.
+
 
 ACTION_COLOR_DICT = {"activation": "#008000a0", "binding": "#0000a080",
                      "catalysis": "#800080a0", "expression": "#ff8c00a0",
@@ -31,8 +26,14 @@ class SdblException(Exception):
 
 
 class Sdbl:
-    def __init__(self, dbfile):
-        self.G = graph.SdblGraph(dbfile)
+    def __init__(self, dbfile, report=None, cache=None):
+        """'cache' is a querycache.SdblQueryCache, or a directory for one,
+        used for the graph queries"""
+        if isinstance(cache, str):
+            import querycache
+            cache = querycache.SdblQueryCache(cache)
+
+        self.G = graph.SdblGraph(dbfile, report=report, cache=cache)
 
     def __len__(self):
         return len(self.G)
@@ -59,41 +60,102 @@ class Sdbl:
         self.G.color_dict = EVIDENCE_COLOR_DICT
         self.G.build_graph(gl, cutoff, modes, schema="evidence", **kwargs)
 
-    def reset(self):
+    @property
+    def report(self):
+        return self.G.report
+
+    def reset(self, report=None):
+        """Start a new graph.  Pass a new SdblReport to instrument the
+        next build separately from the last."""
         dbfile = self.G.dbfile
-        self.G = graph.SdblGraph(dbfile)
+        self.G = graph.SdblGraph(dbfile, report=report, cache=self.G.cache)
 
-    def draw(self, filename, format=None):
-        self.G.draw(filename, format)
+    def draw(self, filename, format=None, draft=None):
+        self.G.draw(filename, format, draft=draft)
 
-    def layout(self, prog="sfdp"):
-        self.G.layout(prog)
+    def layout(self, prog="sfdp", components=False, processes=None,
+            draft=False):
+        """With draft=True, a quick layout drawn as a small preview.  Call
+        layout() again for full quality, then add_disconnected_right()
+        again if it was used."""
+        self.G.layout(prog, components=components, processes=processes,
+                draft=draft)
 
     def write(self, filename):
         self.G.write(filename)
 
-    def colorize_by_column(self, frame, column, warm_cm=plt.cm.Oranges,
-            cool_cm=plt.cm.Blues, center=0.0, cm_lower_stop=0.333,
+    def update(self, add=(), remove=(), relayout=True):
+        """Add and remove genes without rebuilding the graph; see
+        SdblGraph.update"""
+        self.G.update(add=add, remove=remove, relayout=relayout)
+
+    def coarsen(self, min_size=3, max_iter=20):
+        """Collapse densely connected genes into supernodes.  Lay out and
+        draw the coarse graph, then expand() the supernodes of interest."""
+        self.G.coarsen(min_size=min_size, max_iter=max_iter)
+
+    def expand(self, supernode, prog="sfdp"):
+        self.G.expand(supernode, prog=prog)
+
+    def save_snapshot(self, filename):
+        self.G.save_snapshot(filename)
+
+    def load_snapshot(self, filename):
+        """Replace the graph with one saved by save_snapshot"""
+        self.G.load_snapshot(filename)
+
+    def export(self, filename, format, values=None):
+        """Write the edges as tsv, csv, graphml, json or columnar, with node
+        colors and, if given, a 'value' for each node from the mapping
+        'values' (a pandas Series of counts, for instance)"""
+        node_attrs = self.G.node_attributes()
+
+        if values is not None:
+            for k, v in values.items():
+                if k in node_attrs:
+                    node_attrs[k]["value"] = v
+
+        self.G.export(filename, format, node_attrs=node_attrs)
+
+    def colorize_by_column(self, frame, column, warm_cm=None,
+            cool_cm=None, center=0.0, cm_lower_stop=0.333,
             cm_upper_stop=0.8, n_quant=3):
-        cool = cool_cm(np.linspace(cm_upper_stop, cm_lower_stop, n_quant))
-        warm = warm_cm(np.linspace(cm_lower_stop, cm_upper_stop, n_quant))
-        cmap = colors.ListedColormap(np.vstack((cool, warm)))
+        """Fill nodes by quantile of frame[column].  warm_cm and cool_cm
+        default to Oranges and Blues."""
+        import matplotlib.cm as cm
+        import colormap
 
-        data = frame[column]
+        if warm_cm is None:
+            warm_cm = cm.Oranges
 
-        qspace = np.linspace(0, 1, n_quant + 1)
-        dnq = data[data < center].quantile(qspace[:n_quant])
-        upq = data[data > center].quantile(qspace[1:])
+        if cool_cm is None:
+            cool_cm = cm.Blues
 
-        bins = np.concatenate([dnq, [center], upq])
+        cmap = colormap.SdblDivergingColormap(cool_cm, warm_cm)
 
-        cmap_idx = np.digitize(data, bins) - 1
+        with cmap.batch():
+            cmap.component0.configure(lower_stop=cm_upper_stop,
+                    upper_stop=cm_lower_stop, n_quantiles=n_quant)
+            cmap.component1.configure(lower_stop=cm_lower_stop,
+                    upper_stop=cm_upper_stop, n_quantiles=n_quant)
 
-        for n, c in zip(data.index, cmap_idx):
-            self.G.set_node_fill_color(n, colors.to_hex(cmap(c)))
+        data = frame[column]
+
+        bins = colormap.diverging_quantile_bins(data, center, n_quant)
+
+        with self.report.stage("colorize"):
+            for n in data.index:
+                if n not in self.G:
+                    estr = "Node does not exist"
+                    raise graph.SdblGraphException(estr)
+
+            colorizer = colormap.SdblNodeColorizer.from_colormap(cmap)
+            colorizer.apply(self, data, bins)
 
     def to_matplotlib_figure(self, ax=None):
         """Returns a Figure object or draws directly to Axes"""
+        import imageio
+        import matplotlib.pyplot as plt
 
         if not self.gobj.has_layout:
             errstr = "Attempt to draw SdblGraph with no layout"
@@ -119,7 +181,7 @@ class Sdbl:
             return fig
 
     def add_disconnected_right(self):
-        if not self.G.gobj.has_layout:
+        if not self.G.gobj.has_layout or self.G.disconnected is None:
             return
 
         bb = [float(c) for c in self.G.gobj.graph_attr["bb"].split(",")]
@@ -136,6 +198,8 @@ class Sdbl:
                 y = bb[3] - 40
 
     def to_adjacency_matrix(self):
+        import pandas as pd
+
         adict = dict()
 
         for e in sorted(self.edges()):
@@ -160,10 +224,29 @@ class Sdbl:
 
         return adjmat
 
+    def to_sparse_adjacency(self, include_disconnected=False):
+        """Adjacency as an adjacency.SdblSparseAdjacency, built from the
+        edge engine output rather than the pygraphviz edges.  Use its
+        to_csr(), layers() and save() methods for matrices and .npz files."""
+        import adjacency
+
+        nodes = None
+
+        if include_disconnected and self.G.disconnected is not None:
+            nodes = self.G.disconnected
+
+        if len(self.G.edge_data) == 0:
+            return adjacency.SdblSparseAdjacency.from_agraph(self.G.gobj)
+
+        return adjacency.SdblSparseAdjacency.from_edges(
+                self.G.edge_data.items(), nodes=nodes)
+
     def add_legend(self, imgfile):
         if not self.G.gobj.has_layout:
             return
 
+        import imageio
+
         img = imageio.imread(imgfile)
         imsize = img.shape
         xpos = -20 - pixels_to_points(imsize[1], 100) / 2
@@ -180,17 +263,11 @@ class Sdbl:
                 pos=spos, label=" ")
 
     def bloom_centroids(self, b):
-        ew = dict()
-
-        for g in b.amat.index:
-            z = b.amat.loc[g]
-
-            for c in (z[z > 0]).index:
-                ekey = tuple(sorted([g, c]))
-                ew[ekey] = b.amat.loc[g, c]
+        import blossom
 
-                if g in self:
-                    self.G.gobj.add_edge(g, c, weight=ew[ekey], style="invis")
+        rows = [g in self for g in b.amat.index]
+        blossom.add_blossom_edges(self.G.gobj, b.amat, rows=rows,
+                style="invis")
 
         cstable = b.amat.count()
         mx = cstable.max()
@@ -0,0 +1,261 @@
+# Graph snapshots for SDBL
+# Author: Henry Amrhein
+# Date: 19 OCT 2026
+
+import functools
+import json
+import os
+import zlib
+
+import numpy as np
+import pygraphviz
+
+import analytics
+import edge_engine
+
+"""Binary snapshots of a built and laid out SdblGraph"""
+
+__version__ = 1.0
+
+SNAPSHOT_VERSION = 2
+
+# zlib level for the DOT text; level 1 shrinks it about five times for a
+# small fraction of the time Graphviz takes to write or parse it
+DOT_COMPRESSION = 1
+
+
+class SdblSnapshotException(Exception):
+    pass
+
+
+def pack_strings(values):
+    """UTF-8 blob and offsets for a list of strings, so the arrays load
+    without pickling and without padding every string to the longest"""
+    data = [str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(data) + 1, dtype=np.int64)
+    np.cumsum([len(d) for d in data], out=offsets[1:])
+
+    return np.frombuffer(b"".join(data), dtype=np.uint8), offsets
+
+
+def unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    offsets = offsets.tolist()
+
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8")
+            for i in range(len(offsets) - 1)]
+
+
+def node_positions(nodes):
+    """x, y and pinned arrays, with NaN for nodes without a position"""
+    xy = np.full((len(nodes), 2), np.nan)
+    pinned = np.zeros(len(nodes), dtype=bool)
+
+    for i, n in enumerate(nodes):
+        pos = n.attr.get("pos")
+
+        if pos:
+            x, y = pos.rstrip("!").split(",")[:2]
+            xy[i] = (float(x), float(y))
+            pinned[i] = pos.endswith("!")
+
+    return xy, pinned
+
+
+def name_codes(values, table):
+    """int32 codes of 'values' in 'table', a dictionary of name to code
+    that grows with names it hasn't seen.  None is coded as -1."""
+    return np.array([-1 if v is None else table.setdefault(v, len(table))
+        for v in values], dtype=np.int32)
+
+
+def codes(values):
+    """Code table and uint16 codes for a column of a few distinct values"""
+    table = dict()
+    c = np.array([table.setdefault(v, len(table)) for v in values],
+            dtype=np.uint16)
+
+    return list(table), c
+
+
+def save_snapshot(G, filename):
+    """Write the whole state of SdblGraph 'G' to 'filename' as an npz
+    archive.  The graph goes in as the compressed DOT text Graphviz writes
+    for it; node positions, edge data and the query rows kept for
+    update() go in as arrays, with names packed into one UTF-8 blob and
+    referred to by number, and the remaining bookkeeping in a JSON
+    header."""
+    A = G.gobj
+    nodes = A.nodes()
+    table = dict()
+    arrays = dict()
+
+    name_codes([str(n) for n in nodes], table)
+    arrays["node_xy"], arrays["node_pinned"] = node_positions(nodes)
+    arrays["dot"] = np.frombuffer(zlib.compress(A.string().encode("utf-8"),
+        DOT_COMPRESSION), dtype=np.uint8)
+
+    data = list(G.edge_data.items())
+    modes, arrays["data_mode"] = codes([k[2] for k, v in data])
+    directions, arrays["data_direction"] = codes([v.direction
+        for k, v in data])
+    arrowtypes, arrays["data_arrowtype"] = codes([v.arrowtype
+        for k, v in data])
+    arrays["data_u"] = name_codes([k[0] for k, v in data], table)
+    arrays["data_v"] = name_codes([k[1] for k, v in data], table)
+    arrays["data_score"] = np.array([v.score for k, v in data])
+    arrays["data_penwidth"] = np.array([v.penwidth for k, v in data],
+            dtype=np.float64)
+
+    row_columns = None
+
+    if G.rows is not None:
+        row_columns = list()
+
+        for j, column in enumerate(zip(*G.rows)):
+            if all(isinstance(v, int) for v in column):
+                row_columns.append("int")
+                arrays["rows{}".format(j)] = np.array(column, dtype=np.int64)
+            elif all(v is None or isinstance(v, str) for v in column):
+                row_columns.append("str")
+                arrays["rows{}".format(j)] = name_codes(column, table)
+            else:
+                estr = "Can't store query rows column {}".format(j)
+                raise SdblSnapshotException(estr)
+
+    arrays["names_blob"], arrays["names_offsets"] = pack_strings(table)
+
+    header = {"version": SNAPSHOT_VERSION,
+              "has_layout": bool(A.has_layout or (len(nodes) > 0 and
+                  np.isfinite(arrays["node_xy"]).all())),
+              "modes": modes,
+              "directions": directions,
+              "arrowtypes": arrowtypes,
+              "gattr": G.gattr,
+              "nattr": G.nattr,
+              "eattr": getattr(G, "eattr", None),
+              "dbfile": G.dbfile,
+              "color_dict": G.color_dict,
+              "looping": [list(k) for k in G.looping],
+              "disconnected": G.disconnected,
+              "inputs": G.connectivity.inputs,
+              "build_params": G.build_params,
+              "row_columns": row_columns,
+              "row_count": 0 if G.rows is None else len(G.rows)}
+    arrays["header"] = np.frombuffer(json.dumps(header).encode("utf-8"),
+            dtype=np.uint8)
+
+    tmpfile = filename + ".tmp.npz"
+    np.savez(tmpfile, **arrays)
+    os.replace(tmpfile, filename)
+
+
+def read_snapshot(filename):
+    """Header and arrays of a snapshot, read in bulk.  Node positions are
+    in arrays["node_xy"], in the order of the first names of
+    get_strings(arrays, "names"), without building a graph."""
+    try:
+        with np.load(filename, allow_pickle=False) as z:
+            arrays = {k: z[k] for k in z.files}
+    except (OSError, ValueError) as e:
+        estr = "Can't read snapshot {}: {}".format(filename, e)
+        raise SdblSnapshotException(estr)
+
+    if "header" not in arrays:
+        estr = "Not an SDBL snapshot: {}".format(filename)
+        raise SdblSnapshotException(estr)
+
+    header = json.loads(arrays.pop("header").tobytes().decode("utf-8"))
+
+    if header.get("version") != SNAPSHOT_VERSION:
+        estr = "Unsupported snapshot version: {}".format(header.get("version"))
+        raise SdblSnapshotException(estr)
+
+    return header, arrays
+
+
+def get_strings(arrays, name):
+    return unpack_strings(arrays[name + "_blob"], arrays[name + "_offsets"])
+
+
+def edge_data(header, arrays, names):
+    """edge_data dictionary of (source, target, mode) to SdblEdgeProperty"""
+    modes = header["modes"]
+    directions = header["directions"]
+    arrowtypes = header["arrowtypes"]
+    result = dict()
+
+    for u, v, m, s, d, a, p in zip(arrays["data_u"].tolist(),
+            arrays["data_v"].tolist(), arrays["data_mode"].tolist(),
+            arrays["data_score"].tolist(), arrays["data_direction"].tolist(),
+            arrays["data_arrowtype"].tolist(),
+            arrays["data_penwidth"].tolist()):
+        result[(names[u], names[v], modes[m])] = edge_engine.SdblEdgeProperty(
+                score=s, arrowtype=arrowtypes[a], direction=directions[d],
+                penwidth=p)
+
+    return result
+
+
+def query_rows(header, arrays, names):
+    """The query rows kept for update(), or None if there were none"""
+    if header["row_columns"] is None:
+        return None
+
+    if len(header["row_columns"]) == 0:
+        return [tuple() for i in range(header["row_count"])]
+
+    columns = list()
+
+    for j, kind in enumerate(header["row_columns"]):
+        values = arrays["rows{}".format(j)].tolist()
+
+        if kind == "str":
+            values = [None if c < 0 else names[c] for c in values]
+
+        columns.append(values)
+
+    return list(zip(*columns))
+
+
+def graph_from_dot(dot, has_layout):
+    gobj = pygraphviz.AGraph(string=zlib.decompress(dot.tobytes()).decode(
+        "utf-8"))
+    gobj.has_layout = has_layout
+
+    return gobj
+
+
+def load_snapshot(filename, G):
+    """Restore the state saved by save_snapshot into SdblGraph 'G'.  The
+    Graphviz graph is parsed from its DOT text when it is first used, so
+    loading reads only the arrays."""
+    header, arrays = read_snapshot(filename)
+    names = get_strings(arrays, "names")
+
+    G.defer_gobj(functools.partial(graph_from_dot, arrays["dot"],
+        header["has_layout"]))
+    G.gattr = header["gattr"]
+    G.nattr = header["nattr"]
+
+    if header["eattr"] is not None:
+        G.eattr = header["eattr"]
+
+    G.dbfile = header["dbfile"]
+    G.color_dict = header["color_dict"]
+    G.looping = [tuple(k) for k in header["looping"]]
+    G.disconnected = header["disconnected"]
+    G.edge_data = edge_data(header, arrays, names)
+    G.build_params = header["build_params"]
+    G.rows = query_rows(header, arrays, names)
+    G.connectivity = analytics.SdblConnectivity(
+            ((k[0], k[1]) for k in G.edge_data), inputs=header["inputs"])
+
+    # a snapshot is always of a fine graph
+    G.fine = None
+    G.supernodes = dict()
+    G.supernode_labels = dict()
+    G.community_of = dict()
+    G.collapsed = set()
+
+    return G
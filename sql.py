@@ -2,8 +2,19 @@
 # Author: Henry Amrhein
 # Date: 17 OCT 2019
 
+import functools
 import gzip
+import inspect
+import json
+import os
+import concurrent.futures
 import sqlite3
+import threading
+import time
+import uuid
+
+import instrument
+import querycache
 
 """SQL functionality for use by SDBL"""
 
@@ -15,9 +26,17 @@ TEMP_INSERT = "INSERT INTO temp.gl (name) VALUES (?);"
 
 TEMP_DELETE = "DELETE FROM temp.gl;"
 
-ALIAS_SCHEMA = "CREATE TABLE alias (id INTEGER PRIMARY KEY AUTOINCREMENT, prot_id TEXT NOT NULL, alias TEXT NOT NULL, source TEXT NOT NULL);"
+ALIAS_SCHEMA = "CREATE TABLE alias (id INTEGER PRIMARY KEY AUTOINCREMENT, prot_id TEXT NOT NULL, alias TEXT NOT NULL, alias_key TEXT NOT NULL, source TEXT NOT NULL, priority INT NOT NULL);"
+
+ALIAS_INSERT = 'INSERT INTO alias (prot_id, alias, alias_key, source, priority) VALUES (?1, ?2, lower(?2), ?3, ?4);'
+
+ALIAS_RESOLUTION_SCHEMA = "CREATE TABLE alias_resolution (prot_id TEXT PRIMARY KEY, alias TEXT NOT NULL, priority INT NOT NULL) WITHOUT ROWID;"
 
-ALIAS_INSERT = 'INSERT INTO alias (prot_id, alias, source) VALUES (?, ?, ?);'
+ALIAS_RESOLUTION_FILL = "INSERT INTO alias_resolution (prot_id, alias, priority) SELECT prot_id, alias, priority FROM (SELECT prot_id, alias, priority, ROW_NUMBER() OVER (PARTITION BY prot_id ORDER BY priority, alias) AS rn FROM alias) WHERE rn = 1;"
+
+# STRING alias sources from most to least preferred as a display name.
+# Sources that aren't listed rank after all of these.
+ALIAS_SOURCE_PRIORITY = ("Ensembl_MGI", "BLAST_UniProt_GN_Name", "Ensembl_UniProt_GN", "BLAST_UniProt_GN", "Ensembl_HGNC", "Ensembl_EntrezGene", "Ensembl_gene", "Ensembl_UniProt_GN_Synonyms", "BLAST_UniProt_GN_Synonyms", "Ensembl_EntrezGene_synonym")
 
 ACTIONS_SCHEMA = "CREATE TABLE actions (id INTEGER PRIMARY KEY AUTOINCREMENT, item_id_a TEXT NOT NULL, item_id_b TEXT NOT NULL, mode TEXT NOT NULL, action TEXT, is_directional INT, a_is_acting INT, score INT NOT NULL);"
 
@@ -27,14 +46,67 @@ EVIDENCE_SCHEMA = "CREATE TABLE evidence (id INTEGER PRIMARY KEY AUTOINCREMENT,
 
 EVIDENCE_INSERT = 'INSERT INTO evidence (protein1, protein2, neighborhood, fusion, cooccurence, coexpression, experimental, database, textmining, combined_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);'
 
+# Tables keyed on the columns the queries search, for slim profiles.  Rows
+# that collide on the key keep the best priority or score.
+ALIAS_SLIM_SCHEMA = "CREATE TABLE alias (prot_id TEXT NOT NULL, alias TEXT NOT NULL, alias_key TEXT NOT NULL, source TEXT NOT NULL, priority INT NOT NULL, PRIMARY KEY (alias_key, prot_id, alias)) WITHOUT ROWID;"
+
+ALIAS_SLIM_INSERT = 'INSERT INTO alias (prot_id, alias, alias_key, source, priority) VALUES (?1, ?2, lower(?2), ?3, ?4) ON CONFLICT (alias_key, prot_id, alias) DO UPDATE SET priority = min(priority, excluded.priority), source = CASE WHEN excluded.priority < priority THEN excluded.source ELSE source END;'
+
+ACTIONS_SLIM_SCHEMA = "CREATE TABLE actions (item_id_a TEXT NOT NULL, item_id_b TEXT NOT NULL, mode TEXT NOT NULL, action TEXT, is_directional INT NOT NULL, a_is_acting INT NOT NULL, score INT NOT NULL, PRIMARY KEY (item_id_a, item_id_b, mode, is_directional, a_is_acting)) WITHOUT ROWID;"
+
+ACTIONS_SLIM_INSERT = 'INSERT INTO actions (item_id_a, item_id_b, mode, action, is_directional, a_is_acting, score) VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (item_id_a, item_id_b, mode, is_directional, a_is_acting) DO UPDATE SET score = max(score, excluded.score), action = coalesce(action, excluded.action);'
+
+EVIDENCE_SLIM_SCHEMA = "CREATE TABLE evidence (protein1 TEXT NOT NULL, protein2 TEXT NOT NULL, neighborhood INT NOT NULL, fusion INT NOT NULL, cooccurence INT NOT NULL, coexpression INT NOT NULL, experimental INT NOT NULL, database INT NOT NULL, textmining INT NOT NULL, combined_score INT NOT NULL, PRIMARY KEY (protein1, protein2)) WITHOUT ROWID;"
+
+EVIDENCE_SLIM_INSERT = 'INSERT OR IGNORE INTO evidence (protein1, protein2, neighborhood, fusion, cooccurence, coexpression, experimental, database, textmining, combined_score) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);'
+
+# Database build profiles.  alias_sources, channels and action_modes of
+# None keep everything; evidence channels that aren't kept are stored as 0
+# and rows with no kept channel are dropped.  min_score applies to the
+# evidence combined_score and the action score.
+BUILD_PROFILES = {
+        "full": {
+            "alias_sources": None,
+            "channels": None,
+            "action_modes": None,
+            "min_score": 0,
+            "action_text": True,
+            "without_rowid": False
+            },
+        "figures": {
+            "alias_sources": ("Ensembl_MGI", "BLAST_UniProt_GN_Name", "Ensembl_UniProt_GN", "BLAST_UniProt_GN", "Ensembl_HGNC", "Ensembl_EntrezGene"),
+            "channels": ("experimental", "database"),
+            "action_modes": None,
+            "min_score": 150,
+            "action_text": False,
+            "without_rowid": True
+            }
+        }
+
+META_SCHEMA = "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+
+META_INSERT = "INSERT INTO meta (key, value) VALUES (?, ?);"
+
+META_BUILD_ID_QRY = "SELECT value FROM meta WHERE key = 'build_id';"
+
 ALIAS_QRY = "SELECT prot_id, alias FROM alias JOIN gl ON gl.name = alias.alias;"
 
 ALIAS_REV_QRY = "SELECT prot_id, alias FROM alias JOIN gl ON gl.name = alias.prot_id;"
 
+ALIAS_KEY_QRY = "SELECT alias.prot_id, gl.name, alias.alias = gl.name, alias.priority FROM gl JOIN alias ON alias.alias_key = lower(gl.name);"
+
+ALIAS_RESOLVED_QRY = "SELECT alias_resolution.prot_id, alias_resolution.alias FROM gl JOIN alias_resolution ON alias_resolution.prot_id = gl.name;"
+
+ALIAS_INDEX_QRY = "SELECT (SELECT COUNT(*) FROM sqlite_master WHERE name = 'alias_resolution') + (SELECT COUNT(*) FROM pragma_table_info('alias') WHERE name = 'alias_key');"
+
 ACTION_QRY = "SELECT item_id_a, item_id_b, mode, action, is_directional, a_is_acting, score FROM actions INNER JOIN gl ON gl.name = actions.item_id_a AND actions.score > ?;"
 
 EVIDENCE_QRY = 'SELECT protein1, protein2, neighborhood, fusion, cooccurence, coexpression, experimental, database, textmining, combined_score FROM evidence INNER JOIN gl ON gl.name = evidence.protein1 AND combined_score >= ?;'
 
+ACTION_HISTOGRAM_QRY = "SELECT s, COUNT(*) FROM (SELECT MAX(score) AS s FROM gl AS a CROSS JOIN actions ON actions.item_id_a = a.name JOIN gl AS b ON b.name = actions.item_id_b WHERE item_id_a != item_id_b{} GROUP BY MIN(item_id_a, item_id_b), MAX(item_id_a, item_id_b), mode) GROUP BY s ORDER BY s DESC;"
+
+EVIDENCE_HISTOGRAM_QRY = "SELECT s, SUM(n) FROM (SELECT MAX(combined_score) AS s, {} AS n FROM gl AS a CROSS JOIN evidence ON evidence.protein1 = a.name JOIN gl AS b ON b.name = evidence.protein2 WHERE protein1 != protein2 GROUP BY MIN(protein1, protein2), MAX(protein1, protein2)) GROUP BY s ORDER BY s DESC;"
+
 
 ACTION_FRAME_COLS = ("gene1", "gene2", "mode", "action", "directional", "gene1_acting", "score")
 
@@ -45,6 +117,72 @@ class SdblSqlException(Exception):
     pass
 
 
+def database_fingerprint(dbh, database_file):
+    """Build id written by build_sql_stringdb_database, or for databases
+    without one, the file's path, size and modification time"""
+    try:
+        row = dbh.execute(META_BUILD_ID_QRY).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+
+    if row is not None:
+        return "build:{}".format(row[0])
+
+    try:
+        st = os.stat(database_file)
+    except OSError:
+        return None
+
+    return "stat:{}:{}:{}".format(os.path.realpath(database_file),
+            st.st_size, st.st_mtime_ns)
+
+
+def cache_params(value):
+    """Query arguments in a form that hashes the same for equal values"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(cache_params(v) for v in value)
+
+    if isinstance(value, (list, tuple)):
+        return [cache_params(v) for v in value]
+
+    return value
+
+
+def cached_query(method):
+    """Serve a query method's results from the SdblSql cache, when one is
+    set.  The gene list is keyed as a set, as the queries treat it."""
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.cache is None or self.fingerprint is None:
+            return method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        params = {k: cache_params(v) for k, v in bound.arguments.items()
+                  if k != "self"}
+        params["gene_list"] = sorted(set(params["gene_list"]))
+
+        if self.valid_names is not None:
+            params["valid_names"] = sorted(self.valid_names)
+
+        key = self.cache.key(self.fingerprint, method.__name__, params)
+        result = self.cache.get(key)
+
+        if result is not None:
+            self.report.count("cache_hits")
+            return result
+
+        self.report.count("cache_misses")
+        result = method(self, *args, **kwargs)
+        self.cache.put(key, result)
+
+        return result
+
+    return wrapper
+
+
 class SdblSqlCursor:
     def __init__(self, dbh, gene_list):
         self.cursor = dbh.cursor()
@@ -60,48 +198,145 @@ class SdblSqlCursor:
 
 
 class SdblSql:
-    def __init__(self, database_file):
-        self.dbh = sqlite3.connect(database_file)
-        self.cursor = self.dbh.cursor()
-        self.cursor.execute(TEMP_SCHEMA)
+    """Queries against a database made by build_sql_stringdb_database.
+
+    'cache' is a querycache.SdblQueryCache, or a directory for one, that
+    keeps the results of the multiple gene, neighbourhood and histogram
+    queries across runs.
+
+    Each thread gets its own connection, and with it its own temp.gl
+    table, so one SdblSql can be queried from several threads at once."""
+
+    def __init__(self, database_file, report=None, cache=None):
+        self.database_file = database_file
+        self.local = threading.local()
+        self.connections = list()
+        self.lock = threading.Lock()
         self.valid_names = None
+        self.report = instrument.report_or_null(report)
+
+        if isinstance(cache, str):
+            cache = querycache.SdblQueryCache(cache)
+
+        self.cache = cache
+        self.fingerprint = database_fingerprint(self.dbh, database_file)
+
+        # databases built before the alias_key column fall back to exact
+        # matches on the alias column
+        self.alias_index = self.dbh.execute(ALIAS_INDEX_QRY).fetchone()[0] == 2
 
     def __del__(self):
-        self.dbh.close()
+        self.close()
+
+    @property
+    def dbh(self):
+        """The calling thread's connection"""
+        dbh = getattr(self.local, "dbh", None)
+
+        if dbh is None:
+            # closed from whichever thread calls close()
+            dbh = sqlite3.connect(self.database_file, check_same_thread=False)
+            dbh.execute(TEMP_SCHEMA)
+            self.local.dbh = dbh
+
+            with self.lock:
+                self.connections.append((threading.current_thread(), dbh))
+
+        return dbh
 
     def close(self):
-        self.dbh.close()
+        """Close the connections of every thread"""
+        with self.lock:
+            connections = self.connections
+            self.connections = list()
+
+        for thread, dbh in connections:
+            dbh.close()
+
+        self.local = threading.local()
+
+    def close_finished(self):
+        """Close the connections of threads that have exited"""
+        with self.lock:
+            finished = [c for c in self.connections if not c[0].is_alive()]
+            self.connections = [c for c in self.connections
+                                if c[0].is_alive()]
+
+        for thread, dbh in finished:
+            dbh.close()
+
+    def batch_query(self, gene_lists, cutoff_score, schema="action",
+            threads=None):
+        """Run the multiple gene query for each of gene_lists on a thread
+        pool.  Returns the results in the order of gene_lists."""
+        if schema == "action":
+            query = self.actions_query_multiple_genes
+        else:
+            query = self.evidence_query_multiple_genes
+
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            futures = [pool.submit(query, gl, cutoff_score)
+                       for gl in gene_lists]
+
+        self.close_finished()
+
+        return [f.result() for f in futures]
 
     def get_aliases(self, gene_list):
-        with SdblSqlCursor(self.dbh, gene_list) as cur:
-            cur.execute(ALIAS_QRY)
-            aliases = {r[0]: r[1] for r in cur.fetchall()}
+        """Dictionary of protein id to the gene name it was found by.
+        Names are matched without regard to case unless a name also has
+        an exact match.  A protein found by several names takes the one
+        from the most preferred alias source."""
+        with self.report.stage("alias"):
+            with SdblSqlCursor(self.dbh, gene_list) as cur:
+                if self.alias_index:
+                    cur.execute(ALIAS_KEY_QRY)
+                    aliases = resolve_aliases(cur.fetchall())
+                else:
+                    cur.execute(ALIAS_QRY)
+                    aliases = {r[0]: r[1] for r in cur.fetchall()}
+
+        self.report.count("aliases_resolved", len(aliases))
+
         return aliases
 
     def get_reverse_aliases(self, protein_list, restrict=False):
-        with SdblSqlCursor(self.dbh, protein_list) as cur:
-            cur.execute(ALIAS_REV_QRY)
-
-            if self.valid_names is not None:
-                aliases = {r[0]: r[1] for r in cur.fetchall()
-                            if r[1] in self.valid_names}
-            else:
-                aliases = {r[0]: r[1] for r in cur.fetchall()}
+        with self.report.stage("alias"):
+            with SdblSqlCursor(self.dbh, protein_list) as cur:
+                if self.alias_index and self.valid_names is None:
+                    cur.execute(ALIAS_RESOLVED_QRY)
+                else:
+                    cur.execute(ALIAS_REV_QRY)
+
+                if self.valid_names is not None:
+                    aliases = {r[0]: r[1] for r in cur.fetchall()
+                                if r[1] in self.valid_names}
+                else:
+                    aliases = {r[0]: r[1] for r in cur.fetchall()}
 
         if restrict:
             aliases = {a for a in aliases}
 
         return aliases
 
+    def _fetch(self, cur):
+        with self.report.stage("sql_fetch"):
+            rows = cur.fetchall()
+
+        self.report.count("rows_fetched", len(rows))
+
+        return rows
+
     def actions_query_gene(self, gene, cutoff_score):
         result = set()
         aliases = self.get_aliases((gene,))
 
         with SdblSqlCursor(self.dbh, aliases) as cur:
-            cur.execute(ACTION_QRY, (cutoff_score,))
+            with self.report.stage("sql_query"):
+                cur.execute(ACTION_QRY, (cutoff_score,))
 
             res = [(gene, r[1], r[2], r[3], r[4], r[5], r[6])
-                    for r in cur.fetchall()]
+                    for r in self._fetch(cur)]
 
         aliases = self.get_reverse_aliases([r[1] for r in res])
 
@@ -110,15 +345,20 @@ class SdblSql:
 
         return sorted(list(result))
 
+    @cached_query
     def actions_query_multiple_genes(self, gene_list, cutoff_score):
         result = set()
         aliases = self.get_aliases(gene_list)
 
         with SdblSqlCursor(self.dbh, aliases) as cur:
-            cur.execute(ACTION_QRY, (cutoff_score,))
+            with self.report.stage("sql_query"):
+                cur.execute(ACTION_QRY, (cutoff_score,))
 
+            rows = self._fetch(cur)
             res = [(aliases[r[0]], aliases[r[1]], r[2], r[3], r[4], r[5], r[6]) for
-                    r in cur.fetchall() if r[1] in aliases]
+                    r in rows if r[1] in aliases]
+
+        self.report.count("rows_discarded", len(rows) - len(res))
 
         return sorted(res)
 
@@ -126,9 +366,10 @@ class SdblSql:
         aliases = self.get_aliases((gene,))
 
         with SdblSqlCursor(self.dbh, aliases) as cur:
-            cur.execute(EVIDENCE_QRY, (cutoff_score,))
+            with self.report.stage("sql_query"):
+                cur.execute(EVIDENCE_QRY, (cutoff_score,))
 
-            primary = [[gene] + list(r[1:9]) for r in self.cursor.fetchall()]
+            primary = [[gene] + list(r[1:9]) for r in self._fetch(cur)]
 
         aliases = self.get_reverse_aliases([r[1] for r in primary])
 
@@ -137,20 +378,270 @@ class SdblSql:
 
         return sorted(res)
 
+    @cached_query
     def evidence_query_multiple_genes(self, gene_list, cutoff_score):
         aliases = self.get_aliases(gene_list)
 
         with SdblSqlCursor(self.dbh, aliases) as cur:
-            cur.execute(EVIDENCE_QRY, (cutoff_score,))
+            with self.report.stage("sql_query"):
+                cur.execute(EVIDENCE_QRY, (cutoff_score,))
 
+            rows = self._fetch(cur)
             primary = [[aliases[r[0]], aliases[r[1]]] + list(r[2:9]) for r in
-                    cur.fetchall() if r[1] in aliases]
+                    rows if r[1] in aliases]
+
+        self.report.count("rows_discarded", len(rows) - len(primary))
 
         res = [(r[0], r[1], z[0], z[1]) for r in primary
                 for z in zip(EVIDENCE_FRAME_COLS, r[2:9]) if z[1]]
 
         return sorted(res)
 
+    def partner_query(self, gene_list, partners, cutoff_score,
+            schema="action", aliases=None):
+        """Rows of the multiple gene query over gene_list and partners
+        together that start at a gene_list gene: the edges touching
+        gene_list, read without the partners' own edges.  STRING lists
+        each link from both ends and the edge engine merges the two, so
+        the rows starting at a partner are not needed.  'aliases' is
+        get_aliases of both lists, if already known."""
+        if aliases is None:
+            aliases = self.get_aliases(list(gene_list) + list(partners))
+
+        names = set(gene_list)
+        first = [p for p, n in aliases.items() if n in names]
+
+        if schema == "action":
+            qry = ACTION_QRY
+        else:
+            qry = EVIDENCE_QRY
+
+        with SdblSqlCursor(self.dbh, first) as cur:
+            with self.report.stage("sql_query"):
+                cur.execute(qry, (cutoff_score,))
+
+            rows = self._fetch(cur)
+            primary = [[aliases[r[0]], aliases[r[1]]] + list(r[2:]) for r in
+                    rows if r[1] in aliases]
+
+        self.report.count("rows_discarded", len(rows) - len(primary))
+
+        if schema == "action":
+            return sorted(tuple(r) for r in primary)
+
+        res = [(r[0], r[1], z[0], z[1]) for r in primary
+                for z in zip(EVIDENCE_FRAME_COLS, r[2:9]) if z[1]]
+
+        return sorted(res)
+
+    @cached_query
+    def score_histogram(self, gene_list, schema="action", modes=None):
+        """Edge counts by score for the graph induced by gene_list, in one
+        query.  Edges are counted as SdblEdgeEngine merges them: once per
+        gene pair and mode, at the pair's best score (combined_score for
+        the evidence schema).  Self loops are left out.  Returns (score,
+        count) pairs, best score first."""
+        aliases = self.get_aliases(gene_list)
+
+        if schema == "action":
+            if modes is None:
+                qry = ACTION_HISTOGRAM_QRY.format("")
+                params = ()
+            else:
+                modes = list(modes)
+                qry = ACTION_HISTOGRAM_QRY.format(" AND mode IN ({})".format(
+                    ", ".join("?" * len(modes))))
+                params = modes
+        else:
+            columns = EVIDENCE_FRAME_COLS[:7]
+
+            if modes is not None:
+                columns = [c for c in columns if c in modes]
+
+            if len(columns) == 0:
+                return list()
+
+            qry = EVIDENCE_HISTOGRAM_QRY.format(" + ".join(
+                "(MAX({}) > 0)".format(c) for c in columns))
+            params = ()
+
+        with SdblSqlCursor(self.dbh, aliases) as cur:
+            with self.report.stage("sql_query"):
+                cur.execute(qry, params)
+
+            return [(r[0], r[1]) for r in self._fetch(cur) if r[1]]
+
+    def budget_cutoff(self, gene_list, edge_budget=None, density_budget=None,
+            schema="action", modes=None, min_cutoff=0):
+        """Lowest cutoff that keeps the graph of gene_list within
+        edge_budget edges, or within density_budget (edges over possible
+        gene pairs).  The result is meant for the cutoff_score argument of
+        the queries for the same schema.  It never goes below min_cutoff;
+        when even the best score has more edges than the budget, the
+        cutoff keeps just the best scoring edges."""
+        if density_budget is not None:
+            n = len(set(self.get_aliases(gene_list).values()))
+            density_edges = int(density_budget * n * (n - 1) / 2)
+
+            if edge_budget is None or density_edges < edge_budget:
+                edge_budget = density_edges
+
+        if edge_budget is None:
+            estr = "An edge or density budget is required"
+            raise SdblSqlException(estr)
+
+        hist = self.score_histogram(gene_list, schema=schema, modes=modes)
+
+        # actions are kept above the cutoff, evidence at or above it
+        offset = 1 if schema == "action" else 0
+
+        total = 0
+        cutoff = None
+
+        for score, count in hist:
+            if score - offset < min_cutoff:
+                break
+
+            total += count
+
+            if total > edge_budget and cutoff is not None:
+                break
+
+            cutoff = score - offset
+
+            if total > edge_budget:
+                break
+
+        if cutoff is None:
+            cutoff = min_cutoff
+
+        self.report.set("cutoff", cutoff)
+
+        return cutoff
+
+    def _expansion_score(self, row, schema, modes):
+        """Score a row contributes to ranking its partner, or None when the
+        row is not in one of the requested modes"""
+        if schema == "action":
+            if modes is not None and row[2] not in modes:
+                return None
+
+            return row[6]
+
+        if modes is None:
+            return row[9]
+
+        score = max((row[2 + i] for i, c in enumerate(EVIDENCE_FRAME_COLS[:7])
+                if c in modes), default=0)
+
+        return score if score else None
+
+    @cached_query
+    def neighborhood_query(self, gene_list, radius, cutoff_score,
+            schema="action", modes=None, top_n=None, max_nodes=None):
+        """Breadth-first expansion from gene_list out to 'radius' hops.
+
+        Each hop queries the whole frontier at once.  New partners are
+        ranked by their best score to the frontier (in 'modes', if given)
+        and at most top_n of them join the next frontier; the expansion
+        stops adding proteins at max_nodes.  Aliases are resolved once per
+        protein and reused across hops.  Returns every row among the genes
+        reached, in the format of the multiple gene queries."""
+        qry = ACTION_QRY if schema == "action" else EVIDENCE_QRY
+
+        names = self.get_aliases(gene_list)
+        unnamed = set()
+        frontier = sorted(names)
+        reached = set(frontier)
+        rows = list()
+
+        for hop in range(radius + 1):
+            if len(frontier) == 0:
+                break
+
+            with SdblSqlCursor(self.dbh, frontier) as cur:
+                with self.report.stage("sql_query"):
+                    cur.execute(qry, (cutoff_score,))
+
+                hop_rows = self._fetch(cur)
+
+            rows.extend(hop_rows)
+
+            # the last query only collects edges among the final frontier
+            if hop == radius:
+                break
+
+            best = dict()
+
+            for r in hop_rows:
+                if r[1] in reached or r[1] in unnamed:
+                    continue
+
+                score = self._expansion_score(r, schema, modes)
+
+                if score is not None and score > best.get(r[1], -1):
+                    best[r[1]] = score
+
+            lookup = [p for p in best if p not in names]
+
+            if len(lookup) > 0:
+                names.update(self.get_reverse_aliases(lookup))
+                unnamed.update(p for p in lookup if p not in names)
+
+            ranked = sorted((p for p in best if p in names),
+                    key=lambda p: (-best[p], p))
+
+            if top_n is not None:
+                ranked = ranked[:top_n]
+
+            if max_nodes is not None:
+                ranked = ranked[:max(0, max_nodes - len(reached))]
+
+            frontier = sorted(ranked)
+            reached.update(frontier)
+
+        self.report.set("neighborhood_nodes", len(reached))
+
+        kept = [r for r in rows if r[1] in reached]
+        self.report.count("rows_discarded", len(rows) - len(kept))
+
+        if schema == "action":
+            return sorted((names[r[0]], names[r[1]]) + tuple(r[2:7])
+                    for r in kept)
+
+        return sorted((names[r[0]], names[r[1]], z[0], z[1]) for r in kept
+                for z in zip(EVIDENCE_FRAME_COLS, r[2:9]) if z[1])
+
+
+def alias_priority(source):
+    """Rank of a STRING alias source field, which may list several
+    sources separated by spaces; lower is preferred"""
+    ranks = [ALIAS_SOURCE_PRIORITY.index(s) for s in source.split()
+             if s in ALIAS_SOURCE_PRIORITY]
+
+    return min(ranks, default=len(ALIAS_SOURCE_PRIORITY))
+
+
+def resolve_aliases(rows):
+    """Map protein id to gene name from (prot_id, name, exact, priority)
+    rows.  Case-folded matches are dropped for names that have an exact
+    match.  Each protein takes an exact-case match over a case-folded
+    one, then the best priority, then the lowest name, so the result
+    doesn't depend on row order."""
+    exact = {r[1] for r in rows if r[2]}
+    best = dict()
+
+    for prot_id, name, is_exact, priority in rows:
+        if name in exact and not is_exact:
+            continue
+
+        rank = (not is_exact, priority, name)
+
+        if prot_id not in best or rank < best[prot_id]:
+            best[prot_id] = rank
+
+    return {p: r[2] for p, r in best.items()}
+
 
 def chunked_file(file_handle, rows=10000, delim="\t"):
     """Generator for reading chunks of line-based files."""
@@ -179,14 +670,84 @@ def chunked_file(file_handle, rows=10000, delim="\t"):
 
     yield buf
 
-def build_sql_stringdb_database(alias_file, evidence_file, actions_file, database_file, verbose=False):
-    """Build Sqlite database from string-db.org organism files"""
+def build_profile(profile):
+    """Profile settings from a BUILD_PROFILES name or a dictionary, with
+    unset keys taken from the full profile"""
+    if isinstance(profile, str):
+        if profile not in BUILD_PROFILES:
+            estr = "Unknown build profile: {}".format(profile)
+            raise SdblSqlException(estr)
+
+        profile = BUILD_PROFILES[profile]
+
+    settings = dict(BUILD_PROFILES["full"])
+    settings.update(profile)
+
+    return settings
+
+
+def profile_alias_rows(chunk, profile):
+    sources = profile["alias_sources"]
+
+    for r in chunk:
+        if sources is None or any(t in sources for t in r[2].split()):
+            yield (r[0], r[1], r[2], alias_priority(r[2]))
+
+
+def profile_evidence_rows(chunk, profile):
+    channels = profile["channels"]
+    min_score = profile["min_score"]
+
+    if channels is None:
+        keep = None
+    else:
+        keep = [c in channels for c in EVIDENCE_FRAME_COLS[:7]]
+
+    for r in chunk:
+        if int(r[9]) < min_score:
+            continue
+
+        if keep is not None:
+            scores = [int(v) if k else 0 for v, k in zip(r[2:9], keep)]
+
+            if not any(scores):
+                continue
+
+            r = r[:2] + scores + r[9:]
+
+        yield r
+
+
+def profile_actions_rows(chunk, profile):
+    modes = profile["action_modes"]
+    min_score = profile["min_score"]
+
+    for r in chunk:
+        if int(r[6]) < min_score:
+            continue
+
+        if modes is not None and r[2] not in modes:
+            continue
+
+        if not profile["action_text"]:
+            r = r[:3] + [None] + r[4:]
+
+        yield r
+
+
+def build_sql_stringdb_database(alias_file, evidence_file, actions_file, database_file, verbose=False, profile="full"):
+    """Build Sqlite database from string-db.org organism files.  'profile'
+    names an entry of BUILD_PROFILES, or is a dictionary of settings, and
+    selects what is kept and how the tables are stored."""
+    profile = build_profile(profile)
+    slim = profile["without_rowid"]
+
     dbh = sqlite3.connect(database_file)
     dbh.isolation_level = None
     cur = dbh.cursor()
 
     cur.execute("DROP TABLE IF EXISTS alias;")
-    cur.execute(ALIAS_SCHEMA)
+    cur.execute(ALIAS_SLIM_SCHEMA if slim else ALIAS_SCHEMA)
 
     if alias_file.endswith("gz"):
         ifs = gzip.open(alias_file, mode="rb")
@@ -201,18 +762,28 @@ def build_sql_stringdb_database(alias_file, evidence_file, actions_file, databas
 
         cur.execute("BEGIN TRANSACTION;")
 
-        cur.executemany(ALIAS_INSERT, chunk)
+        cur.executemany(ALIAS_SLIM_INSERT if slim else ALIAS_INSERT,
+                profile_alias_rows(chunk, profile))
         cur.execute("COMMIT;")
 
     ifs.close()
 
+    # reverse lookups by prot_id need idx_alias in either profile; the slim
+    # primary key already leads with alias_key
     cur.execute("CREATE INDEX idx_alias ON alias (prot_id, alias);")
 
+    if not slim:
+        cur.execute("CREATE INDEX idx_alias_key ON alias (alias_key);")
+
+    cur.execute("DROP TABLE IF EXISTS alias_resolution;")
+    cur.execute(ALIAS_RESOLUTION_SCHEMA)
+    cur.execute(ALIAS_RESOLUTION_FILL)
+
     if verbose:
         print("done")
 
     cur.execute("DROP TABLE IF EXISTS evidence;")
-    cur.execute(EVIDENCE_SCHEMA)
+    cur.execute(EVIDENCE_SLIM_SCHEMA if slim else EVIDENCE_SCHEMA)
 
     if evidence_file.endswith("gz"):
         ifs = gzip.open(evidence_file, mode="rb")
@@ -226,18 +797,20 @@ def build_sql_stringdb_database(alias_file, evidence_file, actions_file, databas
     for chunk in chunked_file(ifs, rows=10000, delim=" "):
         cur.execute("BEGIN TRANSACTION;")
 
-        cur.executemany(EVIDENCE_INSERT, chunk)
+        cur.executemany(EVIDENCE_SLIM_INSERT if slim else EVIDENCE_INSERT,
+                profile_evidence_rows(chunk, profile))
         cur.execute("COMMIT;")
 
     ifs.close()
 
-    cur.execute("CREATE INDEX idx_evidence ON evidence (protein1, combined_score);")
+    if not slim:
+        cur.execute("CREATE INDEX idx_evidence ON evidence (protein1, combined_score);")
 
     if verbose:
         print("done")
 
     cur.execute("DROP TABLE IF EXISTS actions;")
-    cur.execute(ACTIONS_SCHEMA)
+    cur.execute(ACTIONS_SLIM_SCHEMA if slim else ACTIONS_SCHEMA)
 
     if actions_file.endswith("gz"):
         ifs = gzip.open(actions_file, mode="rb")
@@ -253,15 +826,30 @@ def build_sql_stringdb_database(alias_file, evidence_file, actions_file, databas
     for chunk in chunked_file(ifs, rows=10000, delim="\t"):
         cur.execute("BEGIN TRANSACTION;")
 
-        cur.executemany(ACTIONS_INSERT, chunk)
+        cur.executemany(ACTIONS_SLIM_INSERT if slim else ACTIONS_INSERT,
+                profile_actions_rows(chunk, profile))
         cur.execute("COMMIT;")
 
     ifs.close()
 
-    cur.execute("CREATE INDEX idx_actions ON actions (item_id_a, score);")
+    if not slim:
+        cur.execute("CREATE INDEX idx_actions ON actions (item_id_a, score);")
 
     if verbose:
         print("done")
+        print("Compacting database", end="...", flush=True)
 
-    dbh.close()
+    # a new build id invalidates query caches keyed on the old database
+    cur.execute("DROP TABLE IF EXISTS meta;")
+    cur.execute(META_SCHEMA)
+    cur.executemany(META_INSERT, (("build_id", uuid.uuid4().hex),
+        ("built", time.strftime("%Y-%m-%dT%H:%M:%S")),
+        ("profile", json.dumps(profile, sort_keys=True))))
 
+    cur.execute("ANALYZE;")
+    cur.execute("VACUUM;")
+
+    if verbose:
+        print("done")
+
+    dbh.close()
@@ -5,6 +5,8 @@ import matplotlib
 
 import sdbl
 import colormap
+import h5store
+import instrument
 
 import matplotlib.pyplot as plt
 import matplotlib.colors as colors
@@ -16,32 +18,18 @@ def build_linear_cmap(hot, cold="white", ncolors=256, nbins=16):
     lcm = colors.LinearSegmentedColormap.from_list(name="lcm",
             colors=[cold, hot], N=ncolors)
     cm = colormap.SdblLinearColormap(lcm)
-    cm.component.lower_stop = 0.0
-    cm.component.upper_stop = 1.0
-    cm.component.n_quantiles = nbins
+    cm.component.configure(lower_stop=0.0, upper_stop=1.0, n_quantiles=nbins)
     return cm
 
 def colorize_graph(gobj, cm, data, bins, fontcolor1="black",
         fontcolor2="white"):
-    color_idx = np.digitize(data, bins) - 1
-    G = gobj.G
-
-    for n, c in zip(data.index, color_idx):
-        if n in G:
-            nodecolor = colors.to_hex(cm(c))
-            if cm.luminance_list[c] < 0.55:
-                textcolor = fontcolor2
-            else:
-                textcolor = fontcolor1
-
-            attr = G.gobj.get_node(n).attr
-            attr["style"] = "filled"
-            attr["fillcolor"] = nodecolor
-            attr["fontcolor"] = textcolor
-
-def build_graph(Sobj, gl):
+    colorizer = colormap.SdblNodeColorizer.from_colormap(cm,
+            fontcolors=(fontcolor1, fontcolor2))
+    colorizer.apply(gobj, data, bins)
+
+def build_graph(Sobj, gl, components=False, edge_budget=None, draft=False):
     emodes = ["database", "experimental"]
-    cutoff = 200
+    cutoff = 200 if edge_budget is None else None
     gattr = {"splines": "true",
              "mode": "maxent",
              "K": "0.15",
@@ -51,8 +39,9 @@ def build_graph(Sobj, gl):
              "fontsize": "26",
              "height": "0.80"}
     Sobj.build_evidence_graph(gl, cutoff=cutoff, modes=emodes,
-            graphattr=gattr, edgeattr=eattr, nodeattr=nattr)
-    Sobj.layout(prog="sfdp")
+            graphattr=gattr, edgeattr=eattr, nodeattr=nattr,
+            edge_budget=edge_budget)
+    Sobj.layout(prog="sfdp", components=components, draft=draft)
     Sobj.add_disconnected_right()
 
 def build_colorbar(cm, data):
@@ -66,44 +55,107 @@ def build_colorbar(cm, data):
     fig.tight_layout()
     return fig
 
+def cluster_outputs(clustername, output_dir=".",
+        img_tmpl="{label}_colored_by_10x_counts.{ext}",
+        cb_tmpl="{label}_colored_by_10x_counts_colorbar.{ext}"):
+    """Files written for one cluster: graph images, DOT and colorbars"""
+    fn_template = "{}/{}".format(output_dir, img_tmpl)
+    cb_template = "{}/{}".format(output_dir, cb_tmpl)
+
+    outputs = [fn_template.format(label=clustername, ext=ext)
+            for ext in ("png", "pdf", "svg", "dot")]
+    outputs += [cb_template.format(label=clustername, ext=ext)
+            for ext in ("png", "pdf", "svg")]
+
+    return outputs
+
+def render_cluster(S, store, lbl, bins, fn_template, cb_template,
+        components=False, edge_budget=None, draft=False):
+    """Build, color and draw one cluster.  With draft=True only a small
+    PNG preview of a quick layout is written, named with the extension
+    preview.png."""
+    gmap = store.gene_series()
+    clustername = gmap[lbl]
+
+    cm = build_linear_cmap(store.colors()[lbl])
+    gl = store.marker_genes(clustername)
+    if len(gl) == 0:
+        return
+
+    build_graph(S, gl, components=components, edge_budget=edge_budget,
+            draft=draft)
+
+    data = store.counts(lbl).reindex(gl).dropna()
+
+    with S.report.stage("colorize"):
+        colorize_graph(S, cm, data, bins)
+
+    if draft:
+        S.draw(fn_template.format(label=clustername, ext="preview.png"),
+                format="png")
+        return
+
+    fig = build_colorbar(cm, data)
+
+    for ext in ("png", "pdf", "svg"):
+        S.draw(fn_template.format(label=clustername, ext=ext))
+        fig.savefig(cb_template.format(label=clustername, ext=ext))
+
+    S.write(fn_template.format(label=clustername, ext="dot"))
+
+    plt.close(fig)
+
+def build_cluster(datafile, sdblfile, lbl, output_dir=".",
+        img_tmpl="{label}_colored_by_10x_counts.{ext}",
+        cb_tmpl="{label}_colored_by_10x_counts_colorbar.{ext}",
+        components=False, cache=True, edge_budget=None):
+    """Render a single cluster.  Used by build_figures.py to regenerate
+    clusters independently of each other."""
+    S = sdbl.Sdbl(sdblfile)
+    store = h5store.SdblH5Store(datafile, cache=cache)
+
+    fn_template = "{}/{}".format(output_dir, img_tmpl)
+    cb_template = "{}/{}".format(output_dir, cb_tmpl)
+
+    bins = store.quantile_bins(16, labels=[lbl])[lbl]
+    render_cluster(S, store, lbl, bins, fn_template, cb_template,
+            components=components, edge_budget=edge_budget)
+
+    store.close()
+
 def main(args):
-    S = sdbl.Sdbl(args.sdblfile)
+    S = sdbl.Sdbl(args.sdblfile, cache=args.query_cache)
 
-    meta_df = pd.read_hdf(args.datafile, "/metadata")
-    marker_counts = pd.read_hdf(args.datafile, "/counts_by_cluster_normalized")
+    store = h5store.SdblH5Store(args.datafile, cache=not args.no_cache,
+            cache_dir=args.cache_dir)
 
     fn_template = "{}/{}".format(args.output_dir, args.img_tmpl)
     cb_template = "{}/{}".format(args.output_dir, args.cb_tmpl)
 
-    cmap = dict(zip(meta_df["unified_label"], meta_df["color"]))
-    gmap = dict(zip(meta_df["unified_label"], meta_df["gene_series"]))
+    gmap = store.gene_series()
 
-    qspace = np.linspace(0, 1, 16)
+    qbins = store.quantile_bins(16)
 
-    for lbl in marker_counts:
-        cm = build_linear_cmap(cmap[lbl])
-        gl = pd.read_hdf(args.datafile, "/marker_genes/{}".format(gmap[lbl])).tolist()
-        if len(gl) == 0:
+    for lbl in store.labels:
+        if lbl not in qbins:
             continue
 
-        build_graph(S, gl)
-
-        data = marker_counts.reindex(gl)[lbl].dropna()
-
-        colorize_graph(S, cm, data, data.quantile(qspace))
+        if args.report is not None:
+            S.reset(report=instrument.SdblReport(name=gmap[lbl]))
 
-        fig = build_colorbar(cm, data)
+        render_cluster(S, store, lbl, qbins[lbl], fn_template, cb_template,
+                components=args.component_layout,
+                edge_budget=args.edge_budget, draft=args.draft)
 
-        clustername = gmap[lbl]
+        if args.report is not None:
+            S.report.write_jsonl(args.report)
 
-        for ext in ("png", "pdf", "svg"):
-            S.draw(fn_template.format(label=clustername, ext=ext))
-            fig.savefig(cb_template.format(label=clustername, ext=ext))
-
-        S.write(fn_template.format(label=clustername, ext="dot"))
         S.reset()
 
-        plt.close(fig)
+    store.close()
+
+    if S.G.cache is not None:
+        print("Query cache: {}".format(S.G.cache))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Build 10x TF graph images")
@@ -112,5 +164,12 @@ if __name__ == "__main__":
     parser.add_argument("--img_tmpl", default="{label}_colored_by_10x_counts.{ext}", help="filename template for network graphs - format: {label}_some_text.{ext}")
     parser.add_argument("--cb_tmpl", default="{label}_colored_by_10x_counts_colorbar.{ext}", help="filename template for colorbars - format: {label}_some_text.{ext}")
     parser.add_argument("--output_dir", default=".", help="directory to put output into.  default: current directory")
+    parser.add_argument("--component_layout", action="store_true", help="lay out each connected component in its own process and pack the results")
+    parser.add_argument("--edge_budget", type=int, default=None, help="choose each cluster's cutoff to give about this many edges instead of a fixed cutoff of 200")
+    parser.add_argument("--draft", action="store_true", help="quick layout and a small PNG preview per cluster, for trying parameters.  Run again without it for the full quality images")
+    parser.add_argument("--no_cache", action="store_true", help="do not read or write the columnar cache next to the data file")
+    parser.add_argument("--cache_dir", default=None, help="directory for the columnar cache, for data files in read-only locations.  default: next to the data file")
+    parser.add_argument("--query_cache", default=None, help="directory for cached query results, reused across runs")
+    parser.add_argument("--report", default=None, help="append per-cluster stage timings and counters to this JSON lines file")
     args = parser.parse_args()
     main(args)
@@ -6,6 +6,8 @@ import numpy as np
 import pandas as pd
 import pygraphviz
 
+import analytics
+import blossom
 
 CLUSTER_COLORMAP = ['#ff8c00', '#5ca904', '#ffa500', '#1e90ff', '#0652ff', '#6b8ba4', '#006400', '#c875c4', '#ff0000', '#0000ff', '#014d4e', '#15b01a', '#be0119', '#cf6275', '#580f41', '#7f2b0a', '#a83c09', '#7f5e00', '#030aa7', '#800080', '#029386']
 
@@ -24,27 +26,8 @@ def gen_graph(df, penwidth=15, k="1.0", r="0.5"):
     A.node_attr["fillcolor"] = "#ffffc2"
     A.node_attr["fontname"] = "Arial"
     A.node_attr["fontsize"] = "16"
-    ew = dict()
 
-    for g in df.index:
-        z = df.loc[g]
-        for c in (z[z > 0]).index:
-            ekey = tuple(sorted([g, c]))
-            ew[ekey] = df.loc[g, c]
-            A.add_edge(g, c, weight=df.loc[g, c], style="filled")
-
-    v = ew.values()
-    mn = min(v)
-    mx = max(v)
-    d = mx - mn
-
-    if d == 0:
-        d = 1
-
-    for k, v in ew.items():
-        e = A.get_edge(*k)
-        pw = ((float(v) - mn) / d)
-        e.attr["penwidth"] = pw * penwidth + 2.0
+    blossom.add_blossom_edges(A, df, penwidth=penwidth, style="filled")
 
     return A
 
@@ -90,15 +73,13 @@ def set_cluster_node_edge_color(A, cstable):
     n.attr["fillcolor"] = "{}90".format(CLUSTER_COLORMAP[0])
 
 def annotate_shared_nodes(A, centers):
-    leaves = [n for n in A.nodes() if n not in centers]
-    degree = A.degree(leaves, with_labels=True)
+    conn = analytics.SdblConnectivity(A.edges())
 
-    for k, v in degree.items():
-        if v > 1:
-            n = A.get_node(k)
-            n.attr["style"] = "filled"
-            n.attr["fillcolor"] = "#e0d0d0"
-            n.attr["penwidth"] = "3"
+    for k in conn.shared_leaves(centers):
+        n = A.get_node(k)
+        n.attr["style"] = "filled"
+        n.attr["fillcolor"] = "#e0d0d0"
+        n.attr["penwidth"] = "3"
 
 def adjust_node_labels(A):
     n = A.get_node("Ubiquitous")
@@ -117,9 +98,14 @@ def adjust_node_labels(A):
     n.attr["label"] = "IRC90-\n0814"
     n.attr["width"] = 1.25
 
-def main(args):
-    df = pd.read_table(args.adjacency_table, index_col=0)
-    cstable = pd.read_table(args.cluster_size_table, index_col=0)
+def blossom_outputs(output_base="figure2_blossom_graph", output_dir="."):
+    return ["{}/{}.{}".format(output_dir, output_base, ext)
+            for ext in ("png", "pdf", "svg")]
+
+def build_blossom(adjacency_table, cluster_size_table,
+        output_base="figure2_blossom_graph", output_dir="."):
+    df = pd.read_table(adjacency_table, index_col=0)
+    cstable = pd.read_table(cluster_size_table, index_col=0)
 
     scale_cluster_sizes(cstable)
 
@@ -134,9 +120,12 @@ def main(args):
 
     A.layout(prog="sfdp")
 
-    for ext in ("png", "pdf", "svg"):
-        outfile = "{}.{}".format(args.output_base, ext)
-        A.draw("{}/{}".format(args.output_dir, outfile))
+    for outfile in blossom_outputs(output_base, output_dir):
+        A.draw(outfile)
+
+def main(args):
+    build_blossom(args.adjacency_table, args.cluster_size_table,
+            output_base=args.output_base, output_dir=args.output_dir)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate motif blossom plot")
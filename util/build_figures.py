@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+
+import argparse
+import hashlib
+import os
+import os.path
+
+import h5store
+import pipeline
+import sql
+
+import build_10x_tf_graphs
+import build_blossom_graph
+
+DATABASE_CODE = ["sql.py", "instrument.py", "querycache.py"]
+
+BLOSSOM_CODE = ["blossom.py", "analytics.py", "build_blossom_graph.py"]
+
+CLUSTER_CODE = ["sdbl.py", "graph.py", "sql.py", "edge_engine.py",
+        "colormap.py", "analytics.py", "instrument.py", "h5store.py",
+        "querycache.py", "export.py", "snapshot.py",
+        "build_10x_tf_graphs.py"]
+
+def series_digest(series):
+    h = hashlib.sha256()
+    h.update("\n".join(str(i) for i in series.index).encode("utf-8"))
+    h.update(series.values.astype("float64").tobytes())
+    return h.hexdigest()
+
+def add_database_target(P, args):
+    string_files = [args.alias_file, args.evidence_file, args.actions_file]
+
+    if not all(string_files):
+        return
+
+    P.add(pipeline.SdblTarget("database", [args.database],
+        sql.build_sql_stringdb_database, args=string_files + [args.database],
+        kwargs={"profile": args.profile}, inputs=string_files,
+        params={"profile": args.profile}, code=DATABASE_CODE))
+
+def add_blossom_target(P, args):
+    if args.adjacency_table is None or args.cluster_size_table is None:
+        return
+
+    outputs = build_blossom_graph.blossom_outputs(args.blossom_base,
+            args.figure2_dir)
+
+    P.add(pipeline.SdblTarget("blossom", outputs,
+        build_blossom_graph.build_blossom,
+        args=(args.adjacency_table, args.cluster_size_table,
+            args.blossom_base, args.figure2_dir),
+        inputs=[args.adjacency_table, args.cluster_size_table],
+        code=BLOSSOM_CODE))
+
+def add_cluster_targets(P, args):
+    """One target per cluster.  The HDF5 file itself is not an input; each
+    target depends on its own marker genes, counts and color, so editing
+    one cluster leaves the others current."""
+    if args.datafile is None:
+        return
+
+    store = h5store.SdblH5Store(args.datafile, cache=not args.no_cache)
+    cmap = store.colors()
+    gmap = store.gene_series()
+
+    for lbl in store.labels:
+        if lbl not in gmap:
+            continue
+
+        clustername = gmap[lbl]
+        gl = store.marker_genes(clustername)
+
+        if len(gl) == 0:
+            continue
+
+        params = {"label": str(lbl),
+                  "genes": gl,
+                  "counts": series_digest(store.counts(lbl).reindex(gl)),
+                  "color": cmap[lbl],
+                  "components": args.component_layout,
+                  "edge_budget": args.edge_budget}
+
+        P.add(pipeline.SdblTarget("10x:{}".format(clustername),
+            build_10x_tf_graphs.cluster_outputs(clustername,
+                args.figure10_dir),
+            build_10x_tf_graphs.build_cluster,
+            args=(args.datafile, args.database, lbl, args.figure10_dir),
+            kwargs={"components": args.component_layout,
+                    "cache": not args.no_cache,
+                    "edge_budget": args.edge_budget},
+            inputs=[args.database], params=params, code=CLUSTER_CODE))
+
+    store.close()
+
+def main(args):
+    for d in (args.figure2_dir, args.figure10_dir):
+        os.makedirs(d, exist_ok=True)
+
+    P = pipeline.SdblPipeline(args.manifest, processes=args.processes,
+            verbose=True)
+
+    add_database_target(P, args)
+    add_blossom_target(P, args)
+    add_cluster_targets(P, args)
+
+    if args.dry_run:
+        stale = set(P.targets) if args.force else set(P.stale())
+
+        for t in P.order():
+            print("{}\t{}".format("stale" if t.name in stale else "current",
+                t.name))
+        return
+
+    built = P.run(force=args.force)
+
+    print("Built {} of {} targets".format(len(built), len(P.targets)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild out of date SDBL figures")
+    parser.add_argument("database", help="sdbl database file")
+    parser.add_argument("--alias_file", default=None, help="STRING aliases file.  With the evidence and actions files, the database is rebuilt when they change")
+    parser.add_argument("--evidence_file", default=None, help="STRING detailed links file")
+    parser.add_argument("--actions_file", default=None, help="STRING actions file")
+    parser.add_argument("--profile", default="full", choices=sorted(sql.BUILD_PROFILES), help="database build profile.  default: full")
+    parser.add_argument("--adjacency_table", default=None, help="motif adjacency table for the blossom plot")
+    parser.add_argument("--cluster_size_table", default=None, help="cluster size table for the blossom plot")
+    parser.add_argument("--blossom_base", default="figure2_blossom_graph", help="blossom plot output name")
+    parser.add_argument("--datafile", default=None, help="HDF5 file for the 10x TF graphs")
+    parser.add_argument("--figure2_dir", default="figure2", help="directory for the blossom plot")
+    parser.add_argument("--figure10_dir", default="figure10", help="directory for the 10x TF graphs")
+    parser.add_argument("--component_layout", action="store_true", help="lay out 10x graph components separately")
+    parser.add_argument("--edge_budget", type=int, default=None, help="choose each 10x graph's cutoff to give about this many edges")
+    parser.add_argument("--no_cache", action="store_true", help="do not use the columnar cache of the HDF5 file")
+    parser.add_argument("--manifest", default="sdbl_manifest.json", help="file recording what each output was built from")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes.  default: one per CPU")
+    parser.add_argument("--dry_run", action="store_true", help="list stale targets without building them")
+    parser.add_argument("--force", action="store_true", help="rebuild every target")
+    args = parser.parse_args()
+    main(args)
@@ -2,13 +2,14 @@
 
 import argparse
 
-from sql import chunked_file, build_sql_stringdb_database
+from sql import chunked_file, build_sql_stringdb_database, BUILD_PROFILES
 
 def main(args):
     output_file = "{}/{}".format(args.output_dir, args.output_file)
     
     build_sql_stringdb_database(args.alias_file, args.evidence_file,
-            args.actions_file, output_file, verbose=True)
+            args.actions_file, output_file, verbose=True,
+            profile=args.profile)
 
 
 if __name__ == "__main__":
@@ -17,6 +18,7 @@ if __name__ == "__main__":
     parser.add_argument("evidence_file", help="example: 10090.protein.links.detailed.v11.0.txt.gz")
     parser.add_argument("actions_file", help="example: 10090.protein.actions.v11.0.txt.gz")
     parser.add_argument("output_file", help="database file to output")
+    parser.add_argument("--profile", default="full", choices=sorted(BUILD_PROFILES), help="what to keep in the database.  figures keeps gene symbol aliases and the experimental and database channels in a compact layout.  default: full")
     parser.add_argument("--output_dir", default=".", help="directory to write output into")
 
     args = parser.parse_args()
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+# Query-only and DOT-only entry point.  Only sql and graph, or edge_engine
+# and export for --export, are imported, so none of pandas, matplotlib or
+# imageio are loaded.
+
+import argparse
+import sys
+
+import sql
+
+
+def read_gene_list(genes):
+    if genes == "-":
+        return [l.strip() for l in sys.stdin if l.strip()]
+
+    if "," in genes:
+        return [g for g in genes.split(",") if g]
+
+    with open(genes) as ifs:
+        return [l.strip() for l in ifs if l.strip()]
+
+
+def main(args):
+    gl = read_gene_list(args.genes)
+
+    if args.dot is not None:
+        import sdbl
+
+        S = sdbl.Sdbl(args.sdblfile, cache=args.cache)
+        modes = args.modes.split(",")
+
+        expand = {"radius": args.radius, "top_n": args.top_n,
+                  "max_nodes": args.max_nodes,
+                  "edges_per_node": args.edges_per_node,
+                  "per_mode": args.per_mode}
+
+        if args.schema == "action":
+            S.build_action_graph(gl, args.cutoff, modes, **expand)
+        else:
+            S.build_evidence_graph(gl, args.cutoff, modes, **expand)
+
+        if args.coarsen is not None:
+            S.coarsen(min_size=args.coarsen)
+
+        S.write(args.dot)
+        return
+
+    dbh = sql.SdblSql(args.sdblfile, cache=args.cache)
+
+    if args.radius > 0:
+        res = dbh.neighborhood_query(gl, args.radius, args.cutoff,
+                schema=args.schema, top_n=args.top_n,
+                max_nodes=args.max_nodes)
+    elif args.schema == "action":
+        res = dbh.actions_query_multiple_genes(gl, cutoff_score=args.cutoff)
+    else:
+        res = dbh.evidence_query_multiple_genes(gl, cutoff_score=args.cutoff)
+
+    dbh.close()
+
+    if args.export is not None:
+        import edge_engine
+        import export
+
+        modes = set(args.modes.split(","))
+        ee = edge_engine.SdblEdgeEngine(res)
+        ee.generate_edges()
+
+        if args.edges_per_node is not None:
+            ee.sparsify(args.edges_per_node, per_mode=args.per_mode,
+                    modes=modes)
+
+        export.export_edges(((k, v) for k, v in ee
+            if k[2] in modes and k[0] != k[1]), args.export, args.format)
+        return
+
+    for r in res:
+        print("\t".join(str(c) for c in r))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query a SDBL database without loading plotting libraries")
+    parser.add_argument("sdblfile", help="sdbl database file")
+    parser.add_argument("genes", help="file with one gene per line, a comma separated list, or - for stdin")
+    parser.add_argument("--schema", default="evidence", choices=("action", "evidence"), help="table to query.  default: evidence")
+    parser.add_argument("--cutoff", type=int, default=200, help="minimum score.  default: 200")
+    parser.add_argument("--modes", default="database,experimental", help="comma separated edge modes for --dot and --export")
+    parser.add_argument("--radius", type=int, default=0, help="expand the genes by this many hops.  default: 0")
+    parser.add_argument("--top_n", type=int, default=None, help="new partners kept per hop when expanding, best scores first")
+    parser.add_argument("--max_nodes", type=int, default=None, help="stop expanding at this many genes")
+    parser.add_argument("--edges_per_node", type=int, default=None, help="keep only this many of the best edges at each node for --dot and --export")
+    parser.add_argument("--per_mode", action="store_true", help="apply --edges_per_node to each edge mode separately")
+    parser.add_argument("--export", default=None, help="write the edges to this file without building a graph")
+    parser.add_argument("--format", default="tsv", choices=("tsv", "csv", "graphml", "json", "columnar"), help="format for --export.  default: tsv")
+    parser.add_argument("--cache", default=None, help="directory for cached query results")
+    parser.add_argument("--dot", default=None, help="write an unlaid-out DOT file instead of printing rows")
+    parser.add_argument("--coarsen", type=int, default=None, help="in the --dot output, collapse communities of at least this many genes into supernodes")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+import argparse
+import sys
+import tempfile
+
+import benchmark
+
+
+def print_comparison(report):
+    for name, old, new, ratio, regressed in report:
+        flag = "REGRESSION" if regressed else "ok"
+        print("{:16s} {:10.4f} {:10.4f} {:7.2f}x  {}".format(name, old, new,
+            ratio, flag))
+
+
+def main(args):
+    stages = args.stages.split(",") if args.stages else benchmark.STAGES
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        ctx = benchmark.SdblBenchmarkContext(workdir,
+                n_proteins=args.proteins, degree=args.degree,
+                n_genes=args.genes, cutoff=args.cutoff, seed=args.seed)
+        result = benchmark.run_benchmarks(ctx, stages=stages,
+                repeat=args.repeat, verbose=True)
+
+        failed = list()
+
+        if args.stress:
+            result["stress"] = benchmark.stress_queries(ctx,
+                    threads=args.threads, verbose=True)
+
+            if result["stress"]["mismatches"] > 0:
+                print("Concurrent queries differ from serial queries")
+                failed.append("stress")
+
+    if args.startup:
+        slow = benchmark.run_startup_benchmarks(result, repeat=args.repeat,
+                verbose=True)
+        failed += slow
+
+        for name in slow:
+            print("{} is over budget or loads plotting modules".format(name))
+
+    benchmark.write_results(result, args.output)
+
+    if args.baseline is None:
+        return 1 if failed else 0
+
+    baseline = benchmark.read_results(args.baseline)
+    report = benchmark.compare_results(result, baseline,
+            tolerance=args.tolerance)
+    print_comparison(report)
+
+    return 1 if failed or any(r[-1] for r in report) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SDBL pipeline against a synthetic STRING database")
+    parser.add_argument("--output", default="sdbl_benchmark.json", help="JSON file to write timings into")
+    parser.add_argument("--baseline", default=None, help="JSON file from a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a stage is flagged.  default: 0.25")
+    parser.add_argument("--stages", default=None, help="comma separated stages to run.  default: {}".format(",".join(benchmark.STAGES)))
+    parser.add_argument("--proteins", type=int, default=2000, help="number of synthetic proteins")
+    parser.add_argument("--degree", type=int, default=20, help="mean interaction partners per protein")
+    parser.add_argument("--genes", type=int, default=200, help="size of the queried gene list")
+    parser.add_argument("--cutoff", type=int, default=400, help="score cutoff used by the query stages")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage")
+    parser.add_argument("--seed", type=int, default=12345, help="random seed for the synthetic data")
+    parser.add_argument("--startup", action="store_true", help="also time interpreter startup for the query-only and DOT-only paths against their budgets")
+    parser.add_argument("--stress", action="store_true", help="also check that queries from a thread pool match serial queries")
+    parser.add_argument("--threads", type=int, default=8, help="threads for --stress.  default: 8")
+    parser.add_argument("--workdir", default=None, help="directory for temporary files")
+    args = parser.parse_args()
+    sys.exit(main(args))